@@ -6,6 +6,9 @@ from .simulated_anneling import SimulatedAnneling
 from .brkga import BRKGA
 from .spea2 import SPEA2
 from .pso import PSO
+from .fitness_cache import FitnessStore
+from .parallel import WorkerPool
+from .log_sink import LogSink
 
 __all__ = [
         'HarmonicSearch',
@@ -15,5 +18,8 @@ __all__ = [
         'SimulatedAnneling',
         'BRKGA',
         'SPEA2',
-        'PSO'
+        'PSO',
+        'FitnessStore',
+        'WorkerPool',
+        'LogSink'
            ]
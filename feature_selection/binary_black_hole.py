@@ -44,12 +44,57 @@ class BinaryBlackHole(_BaseMetaHeuristic):
     make_logbook : boolean, (default=False)
             If True, a logbook from DEAP will be made. Check the implementation of ``_make_stats`` for more info
 
-    parallel : boolean, (default=False)
-            Set to True if you want to use python's multiprocessor library for evaluating each solution in parallel
+    parallel : boolean or WorkerPool, (default=False)
+            Set to True if you want to use python's multiprocessor library for evaluating each solution in parallel.
+            A ``WorkerPool`` can be given to share its processes between fits
+
+    executor : one of {'serial', 'threads', 'processes', 'joblib'}, Executor or None, (default=None)
+            Backend evaluating the solutions. Threads suit estimators that release
+            the GIL (liblinear, BLAS heavy models) and processes the pure python
+            ones. Any ``concurrent.futures.Executor`` or ``WorkerPool`` can also be
+            given. If None, ``parallel`` chooses between 'processes' and 'serial'
+
+    n_jobs : integer or None, (default=None)
+            Number of workers of the executor. If None, all the processors are used
+
+    chunksize : positive integer or None, (default=None)
+            Number of solutions sent to a worker at a time
+
+    precompute_kernel : boolean or 'auto', (default='auto')
+            Whether an SVC or NuSVC with a linear or RBF kernel is trained on
+            precomputed kernels, which each worker keeps as square matrices of
+            the size of the dataset. 'auto' only does it while the matrices of
+            all the workers fit in ``FitnessEvaluator.gram_max_bytes``
 
     cv_metric_function : callable, (default=matthews_corrcoef)
             A metric score function as stated in the sklearn http://scikit-learn.org/stable/modules/model_evaluation.html#scoring-parameter
 
+    cache_size : positive integer or None, (default=100000)
+            Maximum number of fitnesses kept in the LRU cache of evaluated masks.
+            If None, the cache grows without bound
+
+    fitness_store : str, FitnessStore or None, (default=None)
+            Persistent storage shared across fits, repetitions and processes. If
+            a path is given, a SQLite ``FitnessStore`` is opened there. Fitnesses
+            are only reused when the dataset, estimator, CV splits and metrics match
+
+    log_sink : str, LogSink or None, (default=None)
+            File where the statistics, hall of fame and Pareto front of each
+            logged generation are appended as soon as they are made, one line
+            of JSON per generation. They are logged even without ``make_logbook``,
+            which then keeps nothing in memory. ``LogSink.read`` reads them back
+
+    fidelities : list of floats in (0, 1) or None, (default=None)
+            Fractions of the rows of stratified subsamples on which the solutions
+            evaluated together are scored first, from the smallest. After each
+            subsample only the best ``promotion_rate`` of them go on, and only
+            the last survivors are evaluated on the full dataset. Each fitness
+            keeps the fraction it came from in ``fitness.fidelity``, and only
+            full dataset fitnesses enter the hall of fame and the Pareto fronts
+
+    promotion_rate : float in (0, 1], (default=0.5)
+            Fraction of the solutions promoted from one subsample to the next
+
     References
     ----------
     .. [1] Elnaz Pashaei and Nizamettin Aydin. 2017. Binary black hole algorithm for feature 
@@ -68,7 +113,16 @@ class BinaryBlackHole(_BaseMetaHeuristic):
                  random_state=None, 
                  parallel=False,
                  cv_metric_function=None, 
-                 features_metric_function=None):
+                 features_metric_function=None,
+                 cache_size=100000,
+                 fitness_store=None,
+                 log_sink=None,
+                 executor=None,
+                 n_jobs=None,
+                 chunksize=None,
+                 precompute_kernel='auto',
+                 fidelities=None,
+                 promotion_rate=0.5):
 
         self.estimator = estimator
         self.number_gen = number_gen
@@ -79,50 +133,60 @@ class BinaryBlackHole(_BaseMetaHeuristic):
         self.make_logbook = make_logbook
         self.random_state = random_state
         self.cv_metric_function = cv_metric_function
+        self.cache_size = cache_size
+        self.fitness_store = fitness_store
+        self.log_sink = log_sink
+        self.executor = executor
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.precompute_kernel = precompute_kernel
+        self.fidelities = fidelities
+        self.promotion_rate = promotion_rate
         self.features_metric_function = features_metric_function
 
         np.random.seed(self.random_state)
 
     def _do_generation(self, galaxy, hof, paretoFront):
 
-        # Evaluate the entire population
-        fitnesses = self._toolbox.map(self._toolbox.evaluate, galaxy)
-        for ind, fit in zip(galaxy, fitnesses):
-            ind.fitness.values = fit
+        # Update Global Information
+        blackhole = np.asarray(hof[0], dtype=bool)
+        radius = sum(hof[0].fitness.wvalues) / galaxy.wvalues.sum()
+
+        # Update stars
+        self._toolbox.update(galaxy, blackhole, radius)
+
+        # Evaluate the stars that moved
+        self._evaluate_population(galaxy)
 
         # Log statistic
         hof.update(galaxy)
         paretoFront.update(galaxy)
 
-        # Update Global Information
-        hof[0].radius = sum(hof[0].fitness.wvalues) / \
-            sum([sum(i.fitness.wvalues) for i in galaxy])
-
-        # Update particles
-        for part in galaxy:
-            self._toolbox.update(part, hof[0])
-
         return galaxy, hof, paretoFront
 
     @staticmethod
-    def _dist(star, blackhole):
-        return np.linalg.norm([blackhole[i] - star[i] for i in range(0, len(star))])
+    def _dist(stars, blackhole):
+        """ Euclidean distance of each star to the black hole, from their Hamming distance"""
+        return np.sqrt(np.count_nonzero(stars != blackhole, axis=-1))
+
+    def _updateStar(self, galaxy, blackhole, radius):
+        """ Move all the stars towards the black hole through the tanh transfer function"""
+        stars = galaxy.masks.astype(float)
+        attraction = self._random_object.rand(*stars.shape) * (blackhole - stars)
+        galaxy.masks = np.abs(np.tanh(stars + attraction)) > self._random_object.rand(*stars.shape)
 
-    def _updateStar(self, star, blackhole):
-        star[:] = [1 if abs(np.tanh(star[x] + self._random_object.uniform(0, 1) *
-                                    (blackhole[x] - star[x]))) > self._random_object.uniform(0, 1) else 0 for x in range(0, self.n_features_)]
+        # The stars crossing the event horizon are born again elsewhere
+        collapsed = np.flatnonzero(self._dist(galaxy.masks, blackhole) < radius)
+        if len(collapsed):
+            galaxy.masks[collapsed] = self._toolbox.population(n=len(collapsed)).masks
 
-        if self._dist(star, blackhole) < blackhole.radius:
-            star[:] = self._toolbox.population(n=1)[0]
+        galaxy.invalidate(slice(None))
 
     def _setup(self, X, y, normalize):
 
         X, y = super()._setup(X, y, normalize)
-        self._toolbox.register("attribute", self._gen_in)
-        self._toolbox.register("star", tools.initIterate,
-                               BaseMask, self._toolbox.attribute)
-        self._toolbox.register("population", tools.initRepeat,
-                               list, self._toolbox.star)
+        # The galaxy is a matrix of masks, with a star per row
+        self._toolbox.register("population", self._random_population)
         self._toolbox.register("update", self._updateStar)
 
         return X, y
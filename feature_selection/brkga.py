@@ -11,6 +11,7 @@ from deap import tools
 from .meta_base import _BaseMetaHeuristic
 from .meta_base import BaseMask
 from .meta_base import *
+from .population import Population, cx_uniform, sel_nsga2
 
 class BRKGA(_BaseMetaHeuristic):
     """
@@ -54,12 +55,77 @@ class BRKGA(_BaseMetaHeuristic):
     make_logbook : boolean, (default=False)
             If True, a logbook from DEAP will be made. If True, a logbook from DEAP will be made. Check the implementation of ``_make_stats`` for more info
 
-    parallel : boolean, (default=False)
-            Set to True if you want to use multiprocessors
+    parallel : boolean or WorkerPool, (default=False)
+            Set to True if you want to use multiprocessors.
+            A ``WorkerPool`` can be given to share its processes between fits
+
+    executor : one of {'serial', 'threads', 'processes', 'joblib'}, Executor or None, (default=None)
+            Backend evaluating the solutions. Threads suit estimators that release
+            the GIL (liblinear, BLAS heavy models) and processes the pure python
+            ones. Any ``concurrent.futures.Executor`` or ``WorkerPool`` can also be
+            given. If None, ``parallel`` chooses between 'processes' and 'serial'
+
+    n_jobs : integer or None, (default=None)
+            Number of workers of the executor. If None, all the processors are used
+
+    chunksize : positive integer or None, (default=None)
+            Number of solutions sent to a worker at a time
+
+    precompute_kernel : boolean or 'auto', (default='auto')
+            Whether an SVC or NuSVC with a linear or RBF kernel is trained on
+            precomputed kernels, which each worker keeps as square matrices of
+            the size of the dataset. 'auto' only does it while the matrices of
+            all the workers fit in ``FitnessEvaluator.gram_max_bytes``
 
     cv_metric_function : callable, (default=matthews_corrcoef)
             A metric score function as stated in the sklearn http://scikit-learn.org/stable/modules/model_evaluation.html#scoring-parameter
 
+    cache_size : positive integer or None, (default=100000)
+            Maximum number of fitnesses kept in the LRU cache of evaluated masks.
+            If None, the cache grows without bound
+
+    fitness_store : str, FitnessStore or None, (default=None)
+            Persistent storage shared across fits, repetitions and processes. If
+            a path is given, a SQLite ``FitnessStore`` is opened there. Fitnesses
+            are only reused when the dataset, estimator, CV splits and metrics match
+
+    log_sink : str, LogSink or None, (default=None)
+            File where the statistics, hall of fame and Pareto front of each
+            logged generation are appended as soon as they are made, one line
+            of JSON per generation. They are logged even without ``make_logbook``,
+            which then keeps nothing in memory. ``LogSink.read`` reads them back
+
+    racing : boolean or float, (default=False)
+            If True, the cross-validation of a new solution stops as soon as its
+            score can not beat the worst elite solution. A float sets the
+            number of standard deviations of the fold scores used to bound the
+            remaining folds (2 if True), 0 bounding them by the mean alone.
+            Only available with ``sorting_method='simple'``.
+            An abandoned solution is ranked by the bound of its score, but never
+            enters the hall of fame, the Pareto front nor the statistics
+
+    fidelities : list of floats in (0, 1) or None, (default=None)
+            Fractions of the rows of stratified subsamples on which the solutions
+            evaluated together are scored first, from the smallest. After each
+            subsample only the best ``promotion_rate`` of them go on, and only
+            the last survivors are evaluated on the full dataset. Each fitness
+            keeps the fraction it came from in ``fitness.fidelity``, and only
+            full dataset fitnesses enter the hall of fame and the Pareto fronts
+
+    promotion_rate : float in (0, 1], (default=0.5)
+            Fraction of the solutions promoted from one subsample to the next
+
+    surrogate : None, 'ridge' or sklearn regressor, (default=None)
+            Model of the score learned from the bits of the evaluated masks. If
+            given, ``surrogate_factor`` times more new solutions are generated
+            and only the ones with the best predicted score are evaluated.
+            'ridge' is a ridge regression updated with each evaluation, and a
+            regressor (e.g. a random forest) is trained again every generation
+
+    surrogate_factor : integer, (default=3)
+            Number of solutions generated per evaluated one when ``surrogate``
+            is given
+
         
     References
     ----------
@@ -67,6 +133,8 @@ class BRKGA(_BaseMetaHeuristic):
     
 
     """
+    # Sorting methods ranking by the score alone, which give racing its threshold
+    _racing_sorting_methods = ('simple',)
 
     def __init__(self, 
                  estimator=None, 
@@ -81,7 +149,19 @@ class BRKGA(_BaseMetaHeuristic):
                  make_logbook=False,
                  random_state=None,
                  parallel=False,
-                 cv_metric_function=None):
+                 cv_metric_function=None,
+                 cache_size=100000,
+                 fitness_store=None,
+                 log_sink=None,
+                 executor=None,
+                 n_jobs=None,
+                 chunksize=None,
+                 precompute_kernel='auto',
+                 racing=False,
+                 fidelities=None,
+                 promotion_rate=0.5,
+                 surrogate=None,
+                 surrogate_factor=3):
 
         self.estimator = estimator
         self.size_pop = size_pop
@@ -96,6 +176,18 @@ class BRKGA(_BaseMetaHeuristic):
         self.random_state = random_state
         self.parallel = parallel
         self.cv_metric_function=cv_metric_function
+        self.cache_size = cache_size
+        self.fitness_store = fitness_store
+        self.log_sink = log_sink
+        self.executor = executor
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.precompute_kernel = precompute_kernel
+        self.racing = racing
+        self.fidelities = fidelities
+        self.promotion_rate = promotion_rate
+        self.surrogate = surrogate
+        self.surrogate_factor = surrogate_factor
         
         np.random.seed(self.random_state)
      
@@ -110,21 +202,17 @@ class BRKGA(_BaseMetaHeuristic):
         self._non_elite_size = self.size_pop - self.elite_size
 
         X, y= super()._setup(X,y,normalize)
-        self._toolbox.register("attribute", self._gen_in)
-        self._toolbox.register("individual", tools.initIterate,
-                              BaseMask, self._toolbox.attribute)
-        self._toolbox.register("population", tools.initRepeat,
-                              list, self._toolbox.individual)
-        self._toolbox.register("mate", tools.cxUniform,
-                              indpb=self.cxUniform_indpb)
-        self._toolbox.register("select", tools.selTournament, tournsize=3)
+        # The population is a matrix of masks, sorted and crossed over as a whole
+        self._toolbox.register("population", self._random_population)
+        self._toolbox.register("mate", cx_uniform, indpb=self.cxUniform_indpb,
+                               random_state=self._random_object)
         
         if(self.sorting_method == 'simple'):
-            self._toolbox.register( "sort", sorted, key=lambda ind: ind.fitness.values[0], reverse=True)
+            self._toolbox.register( "sort", lambda pop: np.argsort(-pop.fitness[:, 0], kind='stable'))
         elif(self.sorting_method == 'NSGA2'):
-            self._toolbox.register( "sort", tools.selNSGA2, k=self.size_pop)
+            self._toolbox.register( "sort", sel_nsga2, k=self.size_pop)
         elif(self.sorting_method == 'NSGA3'):
-            self._toolbox.register( "sort", tools.selNSGA3, k=self.size_pop)
+            self._toolbox.register( "sort", self._deap_order, select=tools.selNSGA3, k=self.size_pop)
         else:
             raise ValueError("The {} sorting method is not valid".format(self.sorting_method))
 
@@ -133,34 +221,35 @@ class BRKGA(_BaseMetaHeuristic):
     def _do_generation(self, pop, hof, paretoFront):
 
         # Ordering
-        ordered = self._toolbox.sort(pop)  
+        ordered = pop[self._toolbox.sort(pop)]
         
         # Partition Elite and Non Elite -> We can repeat elites index, but no repeating non-elite!
-        father_indexes = np.random.randint( 0, self.elite_size, self._n_cross_over)
-        mother_indexes = np.random.permutation(np.arange(self.elite_size, self.elite_size + self._non_elite_size))[0:self._n_cross_over]
-
-        children = [self._toolbox.clone(ordered[ind]) for ind in father_indexes ]
+        # With a surrogate, more children and mutants are made and only the most promising are kept
+        factor = self._screening_factor()
+        father_indexes = self._random_object.randint(0, self.elite_size, self._n_cross_over * factor)
+        mother_indexes = np.concatenate([
+            self._random_object.permutation(np.arange(self.elite_size, self.elite_size + self._non_elite_size))[0:self._n_cross_over]
+            for _ in range(factor)])
 
         # Cross-Over
-        for ind in range(0, len(children)):
-            mother_index = mother_indexes[ind]
-            self._toolbox.mate( children[ind], ordered[mother_index])
-            del children[ind].fitness.values
-
-        # Evaluate the individuals with an invalid fitness ( new individuals)
-        fitnesses = self._toolbox.map(self._toolbox.evaluate, children)
-        for ind, fit in zip(children, fitnesses): 
-            ind.fitness.values = fit
+        children = Population(self._toolbox.mate(ordered.masks[father_indexes], ordered.masks[mother_indexes])[0])
+        children = self._screen(children, self._n_cross_over)
 
         # The botton is replaced by mutant individuals
-        mutant = self._toolbox.population(self.mutant_size)
-        fitnesses = self._toolbox.map(self._toolbox.evaluate, mutant)
-        
-        for ind, fit in zip(mutant, fitnesses):
-            ind.fitness.values = fit
+        mutant = self._toolbox.population(self.mutant_size * factor)
+        mutant = self._screen(mutant, self.mutant_size)
+
+        if self._racing and self.sorting_method == 'simple':
+            # Only the solutions better than the worst elite one matter for the next elite
+            self._race_threshold = ordered.fitness[self.elite_size - 1, 0]
+
+        # Evaluate the new individuals, children and mutants in a single batch
+        offspring = Population.concatenate([children, mutant])
+        self._evaluate_population(offspring)
+        self._race_threshold = None
 
         # The population is entirely replaced by the offspring
-        pop[:] = ordered[0:self.elite_size] + children + mutant
+        pop = Population.concatenate([ordered[0:self.elite_size], offspring])
 
         # Log Statistics
         hof.update(pop)
@@ -0,0 +1,524 @@
+""" Fitness evaluation of the masks of features.
+
+The evaluator keeps everything needed to score a mask (dataset, CV splits,
+estimator and metrics) apart from the metaheuristic, so it can be sent to
+worker processes without the rest of the estimator.
+"""
+from collections import Counter
+import numbers
+import threading
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import clone
+from sklearn.metrics import check_scoring
+from sklearn.svm import SVC, NuSVC
+
+from .fitness_cache import mask_digest
+from .parallel import CostModel
+
+
+class BoundedFitness(tuple):
+    """ Fitness of a mask abandoned by fold racing.
+
+    Its score is an upper bound of the cross valid score, so it is neither
+    cached nor stored.
+    """
+    __slots__ = ()
+
+
+class SubsampleFitness(tuple):
+    """ Fitness of a mask computed on a subsample of the rows.
+
+    ``fidelity`` is the fraction of the rows of the subsample.
+    """
+
+    def __new__(cls, fitness, fidelity):
+        self = super(SubsampleFitness, cls).__new__(cls, fitness)
+        self.fidelity = fidelity
+        return self
+
+    def __reduce__(self):
+        return SubsampleFitness, (tuple(self), self.fidelity)
+
+
+def precomputable_kernel(estimator):
+    """ Return the kernel of an SVM that can be given as a Gram matrix, or None"""
+    if not isinstance(estimator, (SVC, NuSVC)):
+        return None
+    if estimator.kernel == 'linear':
+        return 'linear'
+    if estimator.kernel == 'rbf' and (estimator.gamma in ('scale', 'auto') or
+                                      isinstance(estimator.gamma, numbers.Real)):
+        return 'rbf'
+    return None
+
+
+class FitnessEvaluator(object):
+    """ Score masks of features by cross-validating an estimator.
+
+    The evaluator looks the mask up in the shared cache and in the persistent
+    store before training anything, and saves new fitnesses in both.
+
+    The dataset is kept in Fortran order, so each selected column is one
+    contiguous block, and the columns of a mask are gathered with a single
+    ``np.take`` into a buffer reused by all the evaluations of the thread.
+    The time spent gathering and cross-validating is accumulated in ``stats``.
+    The backends also learn the cost of the masks in ``cost_model``, to
+    schedule the most expensive first, and log each batch in ``schedule_log``.
+
+    The rows are sorted by test fold once, when the evaluator is made, so the
+    test rows of each fold are a contiguous block and the train rows are the
+    two blocks around it. The targets of each fold are sliced in advance as
+    well, and each thread clones the estimator only once.
+
+    An ``SVC`` or ``NuSVC`` with a linear or RBF kernel is trained on
+    precomputed kernels instead: the Gram matrix of all the rows on the
+    selected columns is made with one matrix product, and the train and test
+    kernels of each fold are sliced from it, so libsvm does not evaluate the
+    kernel again for every fold. The Gram matrix of a mask close to one
+    evaluated before by the same thread, like a neighbor in a local search, is
+    updated with the flipped columns only, in O(n_samples^2 * n_flips).
+
+    When a ``threshold`` is given, the folds are raced: after each fold the
+    final score is bounded by assuming the remaining folds score at most
+    ``race_margin`` standard deviations above the mean of the done ones, and
+    the mask is abandoned as soon as that bound falls below the threshold.
+
+    Parameters
+    ----------
+    estimator : sklearn estimator
+            Estimator cloned and trained for each fold
+
+    X : numpy array of shape [n_samples, n_features]
+            Pre-processed training set
+
+    y : numpy array of shape [n_samples]
+            Encoded target values
+
+    cv : list of (train, test) index arrays
+            Cross-validation splits, fixed for every mask. If the test folds do
+            not partition the rows, the folds are sliced with index arrays
+
+    scoring : callable or None, (default=None)
+            Scorer of the estimator on each test fold. If None, the estimator's
+            ``score`` method is used
+
+    features_metric_function : callable or None, (default=None)
+            Function of the mask giving the second objective. If None, the
+            ratio of selected features is used
+
+    shared_cache : SharedFitnessCache or None, (default=None)
+
+    store : FitnessStore or None, (default=None)
+
+    context : str or None, (default=None)
+            Fingerprint of the fitness in the ``store``
+
+    precompute_kernel : boolean or 'auto', (default='auto')
+            Whether to train the SVMs on precomputed Gram matrices, only done
+            for dense datasets. Each worker keeps a few square matrices of the
+            size of the dataset, so 'auto' only does it while those of all the
+            ``n_workers`` fit in ``gram_max_bytes``. The Gram matrices kept for
+            the delta updates take the rest of the share of each worker, up to
+            ``delta_cache_bytes``
+
+    n_workers : positive integer, (default=1)
+            Number of threads or processes evaluating with a copy of the buffers
+
+    race_margin : float, (default=2.0)
+            Standard deviations of the fold scores added to their mean to bound
+            the score of the remaining folds when racing
+    """
+    gram_max_bytes = 2 ** 30
+    # Gram matrix, RBF distances and fold kernels of a worker
+    gram_buffers = 3
+    # Per worker, also bounded by its share of ``gram_max_bytes``
+    delta_cache_bytes = 2 ** 28
+    delta_max_depth = 50
+
+    def __init__(self, estimator, X, y, cv, scoring=None,
+                 features_metric_function=None, shared_cache=None,
+                 store=None, context=None, precompute_kernel='auto',
+                 race_margin=2.0, n_workers=1):
+        self.estimator = estimator
+        self.scoring = scoring
+        self.features_metric_function = features_metric_function
+        self.shared_cache = shared_cache
+        self.store = store
+        self.context = context
+        self.precompute_kernel = precompute_kernel
+        self.race_margin = race_margin
+        self.n_workers = n_workers
+        self.stats = Counter()
+        self.cost_model = CostModel()
+        self.schedule_log = []
+        self._shared = None
+        self._stats_lock = threading.Lock()
+        self._buffers = threading.local()
+        self._scorer = check_scoring(estimator, scoring)
+        self._make_folds(X, y, cv)
+
+        # The kept Gram matrices of a worker take what its share of the budget
+        # leaves besides its other buffers, and one of them is always needed
+        matrix_bytes = self.X.shape[0] ** 2 * self.X.dtype.itemsize
+        share = self.gram_max_bytes // n_workers - (self.gram_buffers - 1) * matrix_bytes
+        self._delta_capacity = max(0, min(share, self.delta_cache_bytes)) // matrix_bytes
+
+        self._kernel = None
+        if precompute_kernel == 'auto':
+            precompute_kernel = self._delta_capacity >= 1
+        if precompute_kernel and not sp.issparse(self.X):
+            self._kernel = precomputable_kernel(estimator)
+
+        if self._kernel is None:
+            self._template = estimator
+        else:
+            self._template = clone(estimator).set_params(kernel='precomputed')
+
+    def _make_folds(self, X, y, cv):
+        order = np.concatenate([np.asarray(test) for _, test in cv])
+        n_samples = X.shape[0]
+        partition = (len(order) == n_samples and
+                     np.array_equal(np.sort(order), np.arange(n_samples)) and
+                     all(len(train) + len(test) == n_samples for train, test in cv))
+
+        if partition:
+            # Sort the rows by test fold, X.T keeps being C-contiguous
+            if sp.issparse(X):
+                X = X[order]
+            else:
+                X = np.take(np.asarray(X).T, order, axis=1).T
+            y = np.asarray(y)[order]
+
+            stops = np.cumsum([len(test) for _, test in cv])
+            self._blocks = [(stop - len(test), stop) for stop, (_, test) in zip(stops, cv)]
+            folds = [(np.r_[0:start, stop:n_samples], np.arange(start, stop))
+                     for start, stop in self._blocks]
+        else:
+            self._blocks = None
+            folds = [(np.asarray(train), np.asarray(test)) for train, test in cv]
+
+        self.X = X if sp.issparse(X) else np.asfortranarray(X)
+        self.y = y
+        self._folds = [(train, test, np.ascontiguousarray(y[train]), np.ascontiguousarray(y[test]))
+                       for train, test in folds]
+
+    @property
+    def n_features(self):
+        return self.X.shape[1]
+
+    def __call__(self, mask, key=None, threshold=None):
+        """ Return the fitness of ``mask``: (cross valid score, feature length score)
+
+        If the score can not reach ``threshold``, the cross-validation may stop
+        early and return a ``BoundedFitness``.
+        """
+        if key is None:
+            key = mask_digest(mask)
+
+        if self.shared_cache is not None:
+            fitness = self.shared_cache.get(key)
+            if fitness is not None:
+                return fitness
+
+        fitness = None
+        if self.store is not None:
+            fitness = self.store.get(self.context, key)
+
+        if fitness is None:
+            fitness = self.compute(mask, threshold)
+            if isinstance(fitness, BoundedFitness):
+                return fitness
+            if self.store is not None:
+                self.store.put(self.context, key, fitness)
+
+        if self.shared_cache is not None:
+            self.shared_cache[key] = fitness
+
+        return fitness
+
+    def timed(self, mask, threshold=None):
+        """ Return the fitness of ``mask``, the seconds it took and whether it was computed.
+
+        A fitness found in a cache is not computed, and its time says nothing
+        about the cost of the mask.
+        """
+        start = time.perf_counter()
+        self._buffers.computed = False
+        fitness = self(mask, threshold=threshold)
+        return fitness, time.perf_counter() - start, self._buffers.computed
+
+    def compute(self, mask, threshold=None):
+        """ Train the estimator on the selected features, without any cache"""
+        self._buffers.computed = True
+        start = time.perf_counter()
+        if self._kernel is not None:
+            gram = self.gram(mask)
+            n_selected = np.count_nonzero(mask)
+        else:
+            columns = self.columns(mask)
+        subset = time.perf_counter()
+
+        # Applying K-Fold Cross Validation
+        n_folds = len(self._folds)
+        scores = []
+        bound = None
+        for fold in range(n_folds):
+            if self._kernel is not None:
+                estimator, X_train, y_train, X_test, y_test = self._kernel_fold(fold, gram, n_selected)
+            else:
+                estimator, X_train, y_train, X_test, y_test = self._fold(fold, columns)
+            estimator.fit(X_train, y_train)
+            scores.append(self._scorer(estimator, X_test, y_test))
+
+            if threshold is not None and 1 < len(scores) < n_folds:
+                bound = self._race_bound(scores, n_folds)
+                if bound < threshold:
+                    break
+                bound = None
+
+        self.record(evaluations=1, fold_fits=len(scores), subset_time=subset - start,
+                    cv_time=time.perf_counter() - subset)
+
+        if self.features_metric_function is None:
+            feature_score = np.count_nonzero(mask) / np.size(mask)
+        else:
+            feature_score = self.features_metric_function(mask)
+
+        if bound is not None:
+            self.record(raced_evaluations=1, saved_fold_fits=n_folds - len(scores))
+            return BoundedFitness((bound, feature_score))
+
+        return np.mean(scores), feature_score
+
+    def _race_bound(self, scores, n_folds):
+        """ Upper bound of the mean score of all the folds, given the first ``scores``"""
+        remaining = np.mean(scores) + self.race_margin * np.std(scores, ddof=1)
+        return (np.sum(scores) + (n_folds - len(scores)) * remaining) / n_folds
+
+    def _fold(self, fold, columns):
+        """ Return the estimator and the train and test sets of ``fold``"""
+        train, test, y_train, y_test = self._folds[fold]
+
+        if sp.issparse(columns):
+            X_train, X_test = columns[train], columns[test]
+        elif self._blocks is not None:
+            # ``columns`` is the transpose of a C-contiguous buffer, so the
+            # train set is made by two block copies into another buffer
+            start, stop = self._blocks[fold]
+            rows = columns.T
+            size = rows.shape[0] * len(train)
+            buffer = getattr(self._buffers, 'train', None)
+            if buffer is None or buffer.shape[0] < size:
+                buffer = np.empty(size, dtype=rows.dtype)
+                self._buffers.train = buffer
+            X_train = buffer[:size].reshape(rows.shape[0], len(train))
+            np.concatenate((rows[:, :start], rows[:, stop:]), axis=1, out=X_train)
+            X_train, X_test = X_train.T, rows[:, start:stop].T
+        else:
+            X_train, X_test = columns[train], columns[test]
+
+        return self._estimator(), X_train, y_train, X_test, y_test
+
+    def _kernel_fold(self, fold, gram, n_selected):
+        """ Return the estimator and the train and test kernels of ``fold``"""
+        train, test, y_train, y_test = self._folds[fold]
+        K_train = gram[np.ix_(train, train)]
+        K_test = gram[np.ix_(test, train)]
+
+        if self._kernel == 'rbf':
+            # ``gram`` holds the squared distances
+            gamma = self._gamma(train, n_selected)
+            for K in (K_train, K_test):
+                np.multiply(K, -gamma, out=K)
+                np.exp(K, out=K)
+
+        return self._estimator(), K_train, y_train, K_test, y_test
+
+    def _gamma(self, train, n_selected):
+        """ Return the gamma the RBF SVM would use, trained on the rows ``train``"""
+        gamma = self._template.gamma
+        if gamma == 'auto':
+            return 1.0 / n_selected
+        if gamma != 'scale':
+            return gamma
+
+        # Variance of X_train, from the sums of each row kept by ``gram``
+        size = float(len(train) * n_selected)
+        mean = self._buffers.sums[train].sum() / size
+        variance = self._buffers.squares[train].sum() / size - mean ** 2
+        return 1.0 / (n_selected * variance) if variance > 0 else 1.0
+
+    def _estimator(self):
+        # The estimator is refitted from scratch, unless it was made to warm start
+        estimator = getattr(self._buffers, 'estimator', None)
+        if estimator is None or getattr(self._template, 'warm_start', False):
+            estimator = clone(self._template)
+            self._buffers.estimator = estimator
+        return estimator
+
+    def gram(self, mask):
+        """ Return the kernel matrix of all the rows on the features of ``mask``.
+
+        With the linear kernel it is the Gram matrix, and with the RBF kernel
+        the matrix of squared distances, before scaling by gamma. The matrix is
+        a buffer of this thread, valid until its next call.
+        """
+        gram, sums = self._linear_gram(np.asarray(mask, dtype=bool))
+        if self._kernel == 'linear':
+            return gram
+
+        distances = getattr(self._buffers, 'distances', None)
+        if distances is None or distances.dtype != gram.dtype:
+            distances = np.empty_like(gram)
+            self._buffers.distances = distances
+
+        squares = gram.diagonal().copy()
+        self._buffers.squares = squares
+        self._buffers.sums = sums
+        # |a - b|^2 = a.a + b.b - 2 a.b
+        np.multiply(gram, -2, out=distances)
+        distances += squares[:, np.newaxis]
+        distances += squares[np.newaxis, :]
+        np.maximum(distances, 0, out=distances)
+        return distances
+
+    def _linear_gram(self, mask):
+        """ Return the Gram matrix and the row sums of X on the features of ``mask``.
+
+        The last Gram matrices of the thread are kept, as many as fit in its
+        share of the memory budget. When one of them was made on a mask differing in
+        fewer features than ``mask`` selects, as the neighbors of a local
+        search do, only the flipped columns are added to or removed from it.
+        """
+        grams = getattr(self._buffers, 'grams', None)
+        if grams is None:
+            grams = self._buffers.grams = []
+
+        n_samples = self.X.shape[0]
+        capacity = max(1, self._delta_capacity)
+
+        # Closest kept matrix, each update adds rounding errors so chains are cut
+        parent, n_flips = None, np.count_nonzero(mask)
+        if capacity > 1:
+            for entry in grams:
+                flips = np.count_nonzero(entry[0] != mask)
+                if flips < n_flips and entry[3] < self.delta_max_depth:
+                    parent, n_flips = entry, flips
+
+        if len(grams) >= capacity and grams[-1] is not parent:
+            entry = grams.pop()
+        else:
+            entry = [None, np.empty((n_samples, n_samples), dtype=self.X.dtype), None, 0]
+
+        if parent is None:
+            # One BLAS call for every pair of rows
+            rows = self.columns(mask).T
+            np.matmul(rows.T, rows, out=entry[1])
+            entry[2] = rows.sum(axis=0)
+            entry[3] = 0
+        else:
+            added = np.flatnonzero(mask & ~parent[0])
+            removed = np.flatnonzero(parent[0] & ~mask)
+            flipped = np.take(self.X.T, np.concatenate((added, removed)), axis=0)
+            signed = flipped.copy()
+            signed[len(added):] *= -1
+
+            # G + A'A - R'R as a single product of the flipped columns
+            np.matmul(signed.T, flipped, out=entry[1])
+            entry[1] += parent[1]
+            entry[2] = parent[2] + signed.sum(axis=0)
+            entry[3] = parent[3] + 1
+            self.record(delta_evaluations=1, flipped_features=int(n_flips))
+
+        entry[0] = mask.copy()
+        grams.insert(0, entry)
+        del grams[capacity:]
+        return entry[1], entry[2]
+
+    def columns(self, mask):
+        """ Return the selected columns of X, as a view of the buffer of this thread.
+
+        The view is only valid until the next call from the same thread.
+        """
+        features = np.flatnonzero(mask)
+        if sp.issparse(self.X):
+            return self.X[:, features]
+
+        buffer = getattr(self._buffers, 'columns', None)
+        if buffer is None or buffer.shape[0] < len(features):
+            # Grow geometrically, so a few large masks do not reallocate each time
+            size = len(features) if buffer is None else max(len(features), buffer.shape[0] * 3 // 2)
+            buffer = np.empty((min(size, self.n_features), self.X.shape[0]), dtype=self.X.dtype)
+            self._buffers.columns = buffer
+
+        # X.T is C-contiguous, so each column is copied as one block
+        rows = buffer[:len(features)]
+        np.take(self.X.T, features, axis=0, out=rows, mode='clip')
+        return rows.T
+
+    def record(self, **stats):
+        """ Add to the counters in ``stats``"""
+        with self._stats_lock:
+            self.stats.update(stats)
+
+    def pop_stats(self):
+        """ Return the counters accumulated since the last call and reset them"""
+        with self._stats_lock:
+            stats, self.stats = self.stats, Counter()
+        return stats
+
+    def share(self):
+        """ Move the dataset and the folds to shared memory, so pickling only sends their names"""
+        if self._shared is not None or sp.issparse(self.X):
+            return self
+
+        from .parallel import SharedArray
+
+        # The indexes and the targets of all the folds are one block each
+        self._local = (self.X, self.y, self._folds)
+        self._fold_sizes = [(len(train), len(test)) for train, test, _, _ in self._folds]
+        self._shared = (SharedArray(self.X), SharedArray(self.y),
+                        SharedArray(np.concatenate([fold[i] for fold in self._folds for i in (0, 1)])),
+                        SharedArray(np.concatenate([fold[i] for fold in self._folds for i in (2, 3)])))
+        self._attach()
+        return self
+
+    def _attach(self):
+        # Views of the shared blocks, made again after unpickling
+        self.X, self.y, indexes, targets = (shared.array for shared in self._shared)
+        self._folds = []
+        start = 0
+        for n_train, n_test in self._fold_sizes:
+            train, test = slice(start, start + n_train), slice(start + n_train, start + n_train + n_test)
+            self._folds.append((indexes[train], indexes[test], targets[train], targets[test]))
+            start += n_train + n_test
+
+    def release(self):
+        """ Free the shared memory made by ``share`` and go back to the local dataset"""
+        if self._shared is None:
+            return
+
+        self.X, self.y, self._folds = self._local
+        del self._local
+        for shared in self._shared:
+            shared.close()
+        self._shared = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_stats_lock'], state['_buffers']
+        state['stats'] = Counter()
+        state['schedule_log'] = []
+        if self._shared is not None:
+            del state['X'], state['y'], state['_folds'], state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stats_lock = threading.Lock()
+        self._buffers = threading.local()
+        if self._shared is not None:
+            self._attach()
@@ -0,0 +1,382 @@
+""" Caching of the fitness of already evaluated masks.
+
+Evaluating a mask means training the estimator with cross-validation, which is
+by far the most expensive step of every metaheuristic. Since the same masks
+are visited many times during a run, their fitness is memoized under a compact
+digest of the packed mask.
+"""
+from collections import OrderedDict, namedtuple
+from functools import partial
+from warnings import warn
+import hashlib
+import re
+import sqlite3
+import threading
+import types
+
+import numpy as np
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+def mask_digest(mask):
+    """ Return a hashable 16 bytes digest of a binary mask.
+
+    The mask is packed into bits (8 features per byte) before hashing, so the
+    cost of the key does not depend on the python objects inside the mask.
+
+    Parameters
+    ----------
+    mask : array-like of shape [n_features]
+            Binary mask of features
+
+    Returns
+    -------
+    digest : bytes
+    """
+    mask = np.asarray(mask, dtype=bool)
+    digest = hashlib.blake2b(np.packbits(mask).tobytes(), digest_size=16)
+    digest.update(np.int64(mask.shape[0]).tobytes())
+    return digest.digest()
+
+
+class FitnessCache(object):
+    """ Bounded LRU mapping from mask digests to fitness values.
+
+    Parameters
+    ----------
+    maxsize : positive integer or None, (default=100000)
+            Maximum number of stored fitnesses. When full, the least recently
+            used entry is evicted. Each entry takes roughly 250 bytes. If None,
+            the cache grows without bound.
+    """
+
+    def __init__(self, maxsize=100000):
+        if maxsize is not None and maxsize < 0:
+            raise ValueError("The cache size should be positive, got {}".format(maxsize))
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        """ Return the fitness stored under ``key`` and mark it as recently used"""
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        if self.maxsize == 0:
+            return
+
+        self._data[key] = value
+        self._data.move_to_end(key)
+
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """ Return the hits, misses, maximum size and current size of the cache"""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+
+def _describe_code(code):
+    # The bytecode, the globals it reads and its constants, nested functions included
+    consts = ", ".join(_describe_code(const) if isinstance(const, types.CodeType) else repr(const)
+                       for const in code.co_consts)
+    return "{}[{}]({})".format(code.co_code.hex(), ",".join(code.co_names), consts)
+
+
+def _describe(obj, seen=()):
+    """ Stable textual description of the objects that define a fitness.
+
+    Functions are described by their code, defaults and closure as well as
+    their name, so two lambdas of a module do not look alike.
+    """
+    if id(obj) in seen:
+        return "<recursion>"
+    seen = seen + (id(obj),)
+
+    if hasattr(obj, 'get_params'):
+        params = obj.get_params(deep=False)
+        return "{}.{}({})".format(
+            type(obj).__module__, type(obj).__name__,
+            ", ".join("{}={}".format(key, _describe(params[key], seen))
+                      for key in sorted(params)))
+    if isinstance(obj, partial):
+        return "partial({}, ({}), {{{}}})".format(
+            _describe(obj.func, seen), ", ".join(_describe(arg, seen) for arg in obj.args),
+            ", ".join("{}={}".format(key, _describe(obj.keywords[key], seen)) for key in sorted(obj.keywords)))
+    if isinstance(obj, types.FunctionType):
+        defaults = obj.__defaults__ or ()
+        kwdefaults = obj.__kwdefaults__ or {}
+        closure = [cell.cell_contents for cell in obj.__closure__ or ()]
+        return "{}.{}<{}>(({}), {{{}}}, [{}])".format(
+            obj.__module__, obj.__qualname__, _describe_code(obj.__code__),
+            ", ".join(_describe(value, seen) for value in defaults),
+            ", ".join("{}={}".format(key, _describe(kwdefaults[key], seen)) for key in sorted(kwdefaults)),
+            ", ".join(_describe(value, seen) for value in closure))
+    if callable(obj) and hasattr(obj, '__qualname__'):
+        return "{}.{}".format(getattr(obj, '__module__', ''), obj.__qualname__)
+
+    description = repr(obj)
+    if re.search(r" at 0x[0-9a-fA-F]+", description):
+        warn("The description of {!r} depends on its memory address, so the fitnesses stored "
+             "with it will not be found by other processes".format(description))
+    return description
+
+
+def fitness_context(X, y, estimator, cv_splits, scorer, features_metric_function=None):
+    """ Fingerprint of everything, besides the mask, that defines a fitness.
+
+    Two fits only share stored fitnesses if they were computed with the same
+    dataset, estimator parameters, cross-validation splits and metrics.
+
+    Parameters
+    ----------
+    X : numpy array of shape [n_samples, n_features]
+            Pre-processed training set
+
+    y : numpy array of shape [n_samples]
+            Encoded target values
+
+    estimator : sklearn estimator
+
+    cv_splits : list of (train, test) index arrays
+
+    scorer : callable or None
+
+    features_metric_function : callable or None
+
+    Returns
+    -------
+    context : str
+            Hexadecimal digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+
+    for array in (X, y):
+        # A Fortran ordered array is hashed through its transpose, without a copy
+        array = np.asarray(array)
+        order = 'F' if array.flags.f_contiguous and not array.flags.c_contiguous else 'C'
+        array = array.T if order == 'F' else np.ascontiguousarray(array)
+        digest.update(str((array.shape, array.dtype.str, order)).encode())
+        digest.update(array.data)
+
+    for train, test in cv_splits:
+        digest.update(np.asarray(test, dtype=np.int64).tobytes())
+        digest.update(b"|")
+
+    for obj in (estimator, scorer, features_metric_function):
+        digest.update(_describe(obj).encode())
+        digest.update(b"|")
+
+    return digest.hexdigest()
+
+
+class FitnessStore(object):
+    """ Persistent fitness storage backed by a SQLite database.
+
+    The store can be shared by several fits, repetitions and processes. Every
+    fitness is saved under the fingerprint given by ``fitness_context`` and the
+    digest of the mask, so re-running an experiment turns most evaluations
+    into database reads.
+
+    Parameters
+    ----------
+    path : str
+            Path of the database file. It is created if it does not exist.
+
+    timeout : float, (default=60)
+            Seconds to wait for a lock held by another process
+    """
+
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        # SQLite connections can not be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS fitness (context TEXT, mask BLOB,"
+                " score REAL, feature_score REAL, PRIMARY KEY (context, mask))")
+            connection.commit()
+            self._local.connection = connection
+        return connection
+
+    def get(self, context, key, default=None):
+        """ Return the fitness saved under ``context`` and mask digest ``key``"""
+        row = self._connect().execute(
+            "SELECT score, feature_score FROM fitness WHERE context=? AND mask=?",
+            (context, key)).fetchone()
+        return default if row is None else tuple(row)
+
+    def put(self, context, key, fitness):
+        """ Save the fitness, committing immediately so it survives a crash"""
+        connection = self._connect()
+        connection.execute("INSERT OR REPLACE INTO fitness VALUES (?, ?, ?, ?)",
+                           (context, key, float(fitness[0]), float(fitness[1])))
+        connection.commit()
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM fitness").fetchone()[0]
+
+    def close(self):
+        """ Close the connection of the current thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def __getstate__(self):
+        # Connections can not be pickled, each process opens its own
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+
+class SharedFitnessCache(object):
+    """ Fitness cache living in shared memory, visible to every worker process.
+
+    It is an open-addressing hash table of mask digests to fitnesses stored in
+    a ``multiprocessing.shared_memory`` block. Pickling the cache only sends
+    the name of the block, so each worker attaches to the same table and a mask
+    evaluated by one process is never evaluated again by another.
+
+    No lock is taken: each slot carries a checksum of its content, written
+    last, so a slot read while another process is writing it is detected and
+    treated as a miss.
+
+    Parameters
+    ----------
+    capacity : positive integer, (default=100000)
+            Expected number of stored fitnesses. The table has at least twice
+            as many slots, and a new fitness overwrites an old one when all the
+            slots on its probing sequence are taken.
+
+    max_probe : positive integer, (default=16)
+            Maximum number of slots visited by a lookup
+    """
+    _dtype = np.dtype([('check', '<u8'), ('key', 'V16'), ('fitness', '<f8', (2,))])
+
+    def __init__(self, capacity=100000, max_probe=16):
+        from multiprocessing import shared_memory
+
+        n_slots = 1
+        while n_slots < 2 * max(capacity, 1):
+            n_slots *= 2
+
+        self.capacity = capacity
+        self.max_probe = max_probe
+        self.hits = 0
+        self.misses = 0
+        self._n_slots = n_slots
+        self._shm = shared_memory.SharedMemory(create=True, size=n_slots * self._dtype.itemsize)
+        self._owner = True
+        self._table = np.ndarray((n_slots,), dtype=self._dtype, buffer=self._shm.buf)
+        self._table['check'] = 0
+
+    @staticmethod
+    def _checksum(key, fitness):
+        digest = hashlib.blake2b(key, digest_size=8)
+        digest.update(np.asarray(fitness, dtype='<f8').tobytes())
+        # Zero marks an empty slot
+        return int.from_bytes(digest.digest(), 'little') | 1
+
+    def _probe(self, key):
+        start = int.from_bytes(key[:8], 'little')
+        return [(start + i) & (self._n_slots - 1) for i in range(self.max_probe)]
+
+    def get(self, key, default=None):
+        """ Return the fitness stored under the mask digest ``key``"""
+        for slot in self._probe(key):
+            record = self._table[slot].copy()
+            if record['check'] == 0:
+                break
+
+            if record['key'].tobytes() == key:
+                fitness = tuple(float(value) for value in record['fitness'])
+                if self._checksum(key, fitness) != record['check']:
+                    break
+                self.hits += 1
+                return fitness
+
+        self.misses += 1
+        return default
+
+    def __setitem__(self, key, fitness):
+        slots = self._probe(key)
+        target = slots[0]
+        for slot in slots:
+            check = self._table['check'][slot]
+            if check == 0 or self._table['key'][slot].tobytes() == key:
+                target = slot
+                break
+
+        fitness = (float(fitness[0]), float(fitness[1]))
+        record = self._table[target:target + 1]
+        record['check'] = 0
+        record['key'] = np.void(key)
+        record['fitness'] = fitness
+        record['check'] = self._checksum(key, fitness)
+
+    def __len__(self):
+        return int(np.count_nonzero(self._table['check']))
+
+    def info(self):
+        """ Return the hits and misses of this process, the capacity and current size"""
+        return CacheInfo(self.hits, self.misses, self.capacity, len(self))
+
+    def close(self):
+        """ Detach from the shared memory block. The owner also frees it."""
+        if self._shm is None:
+            return
+        self._table = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+        self._shm = None
+
+    def __getstate__(self):
+        if self._shm is None:
+            raise ValueError("The shared fitness cache is closed")
+        return {'capacity': self.capacity, 'max_probe': self.max_probe,
+                'n_slots': self._n_slots, 'name': self._shm.name}
+
+    def __setstate__(self, state):
+        from .parallel import attach_shared_memory
+
+        self.capacity = state['capacity']
+        self.max_probe = state['max_probe']
+        self.hits = 0
+        self.misses = 0
+        self._n_slots = state['n_slots']
+        self._shm = attach_shared_memory(state['name'])
+        self._owner = False
+        self._table = np.ndarray((self._n_slots,), dtype=self._dtype, buffer=self._shm.buf)
@@ -1,5 +1,6 @@
 from __future__ import print_function
 import random
+import numpy as np
 from timeit import time
 
 from deap import base
@@ -8,33 +9,20 @@ from deap import tools
 from .meta_base import _BaseMetaHeuristic
 from .meta_base import BaseMask
 from .meta_base import *
+from .population import Population, sel_tournament, sel_best, sel_roulette, sel_spea2
+from .population import cx_uniform, cx_one_point, cx_two_point, mut_binary_uniform
 
 def mutBinaryUniform(individual, indpb, prob):
     """Mutate an individual by replacing attributes, with probability *indpb*,
     by 1  with ``prob`` chance, otherwise 0.
     :param individual: :term:`Sequence <sequence>` individual to be mutated.
-    :param low: The lower bound or a :term:`python:sequence` of
-                of lower bounds of the range from wich to draw the new
-                integer.
-    :param up: The upper bound or a :term:`python:sequence` of
-               of upper bounds of the range from wich to draw the new
-               integer.
     :param indpb: Independent probability for each attribute to be mutated.
+    :param prob: Probability of a mutated attribute to become 1.
     :returns: A tuple of one individual.
     """
-    size = len(individual)
-    if not isinstance(low, Sequence):
-        low = repeat(low, size)
-    elif len(low) < size:
-        raise IndexError("low must be at least the size of individual: %d < %d" % (len(low), size))
-    if not isinstance(up, Sequence):
-        up = repeat(up, size)
-    elif len(up) < size:
-        raise IndexError("up must be at least the size of individual: %d < %d" % (len(up), size))
-
-    for i, xl, xu in zip(xrange(size), low, up):
+    for i in range(len(individual)):
         if random.random() < indpb:
-            individual[i] = int(random.uniform() < prob)
+            individual[i] = int(random.random() < prob)
 
     return individual,
 
@@ -90,11 +78,67 @@ class GeneticAlgorithm(_BaseMetaHeuristic):
     make_logbook : boolean, (default=False)
             If True, a logbook from DEAP will be made
 
-    parallel : boolean, (default=False)
-            Set to True if you want to use multiprocessors
+    parallel : boolean or WorkerPool, (default=False)
+            Set to True if you want to use multiprocessors.
+            A ``WorkerPool`` can be given to share its processes between fits
+
+    executor : one of {'serial', 'threads', 'processes', 'joblib'}, Executor or None, (default=None)
+            Backend evaluating the solutions. Threads suit estimators that release
+            the GIL (liblinear, BLAS heavy models) and processes the pure python
+            ones. Any ``concurrent.futures.Executor`` or ``WorkerPool`` can also be
+            given. If None, ``parallel`` chooses between 'processes' and 'serial'
+
+    n_jobs : integer or None, (default=None)
+            Number of workers of the executor. If None, all the processors are used
+
+    chunksize : positive integer or None, (default=None)
+            Number of solutions sent to a worker at a time
+
+    precompute_kernel : boolean or 'auto', (default='auto')
+            Whether an SVC or NuSVC with a linear or RBF kernel is trained on
+            precomputed kernels, which each worker keeps as square matrices of
+            the size of the dataset. 'auto' only does it while the matrices of
+            all the workers fit in ``FitnessEvaluator.gram_max_bytes``
 
     cv_metric_function : callable, (default=matthews_corrcoef)            
             A metric score function as stated in the sklearn http://scikit-learn.org/stable/modules/model_evaluation.html#scoring-parameter
+
+    cache_size : positive integer or None, (default=100000)
+            Maximum number of fitnesses kept in the LRU cache of evaluated masks.
+            If None, the cache grows without bound
+
+    fitness_store : str, FitnessStore or None, (default=None)
+            Persistent storage shared across fits, repetitions and processes. If
+            a path is given, a SQLite ``FitnessStore`` is opened there. Fitnesses
+            are only reused when the dataset, estimator, CV splits and metrics match
+
+    log_sink : str, LogSink or None, (default=None)
+            File where the statistics, hall of fame and Pareto front of each
+            logged generation are appended as soon as they are made, one line
+            of JSON per generation. They are logged even without ``make_logbook``,
+            which then keeps nothing in memory. ``LogSink.read`` reads them back
+
+    fidelities : list of floats in (0, 1) or None, (default=None)
+            Fractions of the rows of stratified subsamples on which the solutions
+            evaluated together are scored first, from the smallest. After each
+            subsample only the best ``promotion_rate`` of them go on, and only
+            the last survivors are evaluated on the full dataset. Each fitness
+            keeps the fraction it came from in ``fitness.fidelity``, and only
+            full dataset fitnesses enter the hall of fame and the Pareto fronts
+
+    promotion_rate : float in (0, 1], (default=0.5)
+            Fraction of the solutions promoted from one subsample to the next
+
+    surrogate : None, 'ridge' or sklearn regressor, (default=None)
+            Model of the score learned from the bits of the evaluated masks. If
+            given, ``surrogate_factor`` times more new solutions are generated
+            and only the ones with the best predicted score are evaluated.
+            'ridge' is a ridge regression updated with each evaluation, and a
+            regressor (e.g. a random forest) is trained again every generation
+
+    surrogate_factor : integer, (default=3)
+            Number of solutions generated per evaluated one when ``surrogate``
+            is given
     """
 
     def __init__(self,
@@ -106,6 +150,7 @@ class GeneticAlgorithm(_BaseMetaHeuristic):
                  cxUniform_indpb=0.5,
                  individual_mut_prob=0.05, 
                  gene_mutation_prob=0.05,
+                 mutation_skewed_prob=0.5,
                  selection_method='tournament',
                  tournament_size=3,
                  verbose=0,
@@ -113,7 +158,19 @@ class GeneticAlgorithm(_BaseMetaHeuristic):
                  make_logbook=False, 
                  random_state=None, 
                  parallel=False,
-                 cv_metric_function=None):
+                 cv_metric_function=None,
+                 name="GeneticAlgorithm",
+                 cache_size=100000,
+                 fitness_store=None,
+                 log_sink=None,
+                 executor=None,
+                 n_jobs=None,
+                 chunksize=None,
+                 precompute_kernel='auto',
+                 fidelities=None,
+                 promotion_rate=0.5,
+                 surrogate=None,
+                 surrogate_factor=3):
 
         self.name = name
         self.estimator = estimator
@@ -124,6 +181,17 @@ class GeneticAlgorithm(_BaseMetaHeuristic):
         self.make_logbook = make_logbook
         self.random_state = random_state
         self.cv_metric_function = cv_metric_function
+        self.cache_size = cache_size
+        self.fitness_store = fitness_store
+        self.log_sink = log_sink
+        self.executor = executor
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.precompute_kernel = precompute_kernel
+        self.fidelities = fidelities
+        self.promotion_rate = promotion_rate
+        self.surrogate = surrogate
+        self.surrogate_factor = surrogate_factor
 
         self.individual_mut_prob = individual_mut_prob
         self.gene_mutation_prob = gene_mutation_prob
@@ -139,72 +207,73 @@ class GeneticAlgorithm(_BaseMetaHeuristic):
     def _setup(self, X, y, normalize):
         X, y = super()._setup(X,y,normalize)
 
-        self._toolbox.register("attribute", self._gen_in)
-        
-        self._toolbox.register("individual", tools.initIterate,
-                               BaseMask, self._toolbox.attribute)
-        
-        self._toolbox.register("population", tools.initRepeat,
-                               list, self._toolbox.individual)
+        # The population is a matrix of masks, bred as a whole
+        self._toolbox.register("population", self._random_population)
         
         if self.cross_over_type == 'uniform':
-                self._toolbox.register("mate", tools.cxUniform,
-                               indpb=self.cxUniform_indpb)
+                self._toolbox.register("mate", cx_uniform, indpb=self.cxUniform_indpb,
+                               random_state=self._random_object)
         elif self.cross_over_type == 'onePoint':
-                self._toolbox.register("mate", tools.cxOnePoint)
+                self._toolbox.register("mate", cx_one_point, random_state=self._random_object)
         elif self.cross_over_type == 'twoPoint':
-                self._toolbox.register("mate", tools.cxTwoPoint)
+                self._toolbox.register("mate", cx_two_point, random_state=self._random_object)
         else:
                 raise ValueError("Unkown cross_over_type: {}".format(self.cross_over_type))
         
+        # Every selection returns the indexes of the selected rows
         if self.selection_method == "tournament":
-            self._toolbox.register("select", tools.selTournament, tournsize=self.tournament_size)
+            self._toolbox.register("select", sel_tournament, tournsize=self.tournament_size,
+                                   random_state=self._random_object)
         elif self.selection_method == 'roullete':
-            self._toolbox.register("select", tools.selRoulette)
+            self._toolbox.register("select", sel_roulette, random_state=self._random_object)
         elif self.selection_method == 'NSGA2':
-            self._toolbox.register("select", tools.selNSGA2)
+            self._toolbox.register("select", self._deap_order, select=tools.selNSGA2)
         elif self.selection_method == 'SPEA2':
-            self._toolbox.register("select", tools.selSPEA2)
+            self._toolbox.register("select", sel_spea2)
         elif self.selection_method == 'best':
-            self._toolbox.register("select", tools.selBest)
+            self._toolbox.register("select", sel_best)
         else:
             raise ValueError("Unkown selection_method: {}".format(self.selection_method))
 
-        self._toolbox.register("mutate", mutBinaryUniform,prob=self.mutation_skewed_prob,
-                               indpb=self.gene_mutation_prob)
+        self._toolbox.register("mutate", mut_binary_uniform, prob=self.mutation_skewed_prob,
+                               indpb=self.gene_mutation_prob, random_state=self._random_object)
 
         return X, y
 
     def _do_generation(self, pop, hof, paretoFront):
 
-        # Select the next generation individuals through tournament
-        offspring = self._toolbox.select(pop, len(pop))
-        offspring = list(map(self._toolbox.clone, offspring))
-
-        # Apply crossover 
-        for child1, child2 in zip(offspring[::2], offspring[1::2]):
-            if random.random() < self.cross_over_prob:
-                self._toolbox.mate(child1, child2)
-                del child1.fitness.values
-                del child2.fitness.values
-        
-        # Apply Mutation
-        for mutant in offspring:
-            if random.random() < self.individual_mut_prob:
-                self._toolbox.mutate(mutant)
-                del mutant.fitness.values
+        # With a surrogate, more offspring are bred and only the most promising are kept
+        offspring = Population.concatenate([self._breed(pop) for _ in range(self._screening_factor())])
+        offspring = self._screen(offspring, len(pop))
 
         # Evaluate the individuals with an invalid fitness ( new individuals)
-        invalid_ind = [ ind for ind in offspring if not ind.fitness.valid]
-        fitnesses = self._toolbox.map( self._toolbox.evaluate, invalid_ind)
-        for ind, fit in zip(invalid_ind, fitnesses):
-            ind.fitness.values = fit
+        self._evaluate_population(offspring)
 
         # The population is entirely replaced by the offspring
-        pop[:] = offspring
+        pop = offspring
 
         # Log statistic
         hof.update(pop)
         paretoFront.update(pop)
 
         return pop, hof, paretoFront
+
+    def _breed(self, pop):
+        """ Return offspring made by selection, crossover and mutation of ``pop``"""
+        # Select the next generation individuals
+        offspring = pop[self._toolbox.select(pop, k=len(pop))]
+
+        # Apply crossover to the pairs drawn, all at once
+        first = np.arange(0, len(offspring) - 1, 2)
+        first = first[self._random_object.rand(len(first)) < self.cross_over_prob]
+        second = first + 1
+        offspring.masks[first], offspring.masks[second] = self._toolbox.mate(
+            offspring.masks[first], offspring.masks[second])
+        offspring.invalidate(np.concatenate((first, second)))
+        
+        # Apply Mutation
+        mutants = np.flatnonzero(self._random_object.rand(len(offspring)) < self.individual_mut_prob)
+        offspring.masks[mutants] = self._toolbox.mutate(offspring.masks[mutants])
+        offspring.invalidate(mutants)
+
+        return offspring
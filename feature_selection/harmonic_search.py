@@ -4,12 +4,105 @@ from deap import base
 from deap import tools
 from .meta_base import *
 from .meta_base import _BaseMetaHeuristic
+from .population import Population, mut_flip_bit, sel_nsga2, sel_spea2
 from sklearn.svm import SVC
 import random
 from sklearn.base import clone
 from multiprocessing import Pool
 
 
+class HarmonyMemory(Population):
+    """ Harmony memory keeping the rank of its harmonies as new ones come.
+
+    With the 'best' ordering the rows stay sorted by score, so a new harmony is
+    admitted, or rejected, with a binary search. With 'NSGA2' the Pareto front
+    and crowding distance of each row are kept, and a new harmony only updates
+    the fronts from its own down. Otherwise the memory and the new harmonies
+    are sorted again together with ``sort``.
+
+    Parameters
+    ----------
+    sorting_method : one of {'best', 'NSGA2', 'SPEA2'}, (default='best')
+            How the harmonies are ranked
+
+    sort : callable or None, (default=None)
+            Return the indexes of the rows kept of a ``Population``, for the
+            orderings not updated incrementally
+    """
+
+    def __init__(self, masks, fitness=None, fidelity=None, sorting_method='best', sort=None, bounded=None):
+        super(HarmonyMemory, self).__init__(masks, fitness, fidelity, bounded)
+        self.sorting_method = sorting_method
+        self.sort = sort
+        self._ranked = False
+        self._fronts = None
+        self._crowding = None
+
+    def admit(self, harmonies):
+        """ Add the evaluated ``harmonies``, each one replacing the worst harmony
+        of the memory if it is better. Return the number of harmonies admitted.
+        """
+        if self.sorting_method == 'best':
+            return sum(self._admit_best(harmonies, row) for row in range(len(harmonies)))
+        if self.sorting_method == 'NSGA2':
+            return sum(self._admit_nsga2(harmonies, row) for row in range(len(harmonies)))
+
+        merged = Population.concatenate([self, harmonies])
+        kept = np.asarray(self.sort(merged))
+        self.masks, self.fitness, self.fidelity = merged.masks[kept], merged.fitness[kept], merged.fidelity[kept]
+        self.bounded = merged.bounded[kept]
+        return np.count_nonzero(kept >= len(merged) - len(harmonies))
+
+    def _admit_best(self, harmonies, row):
+        if not self._ranked:
+            order = np.argsort(-self.fitness[:, 0], kind='stable')
+            self.masks, self.fitness, self.fidelity = self.masks[order], self.fitness[order], self.fidelity[order]
+            self.bounded = self.bounded[order]
+            self._ranked = True
+
+        # As the stable sort did, a new harmony goes after the ones with the same score
+        position = len(self) - np.searchsorted(self.fitness[::-1, 0], harmonies.fitness[row, 0], side='left')
+        if position == len(self):
+            return False
+
+        for array, new in ((self.masks, harmonies.masks), (self.fitness, harmonies.fitness),
+                           (self.fidelity, harmonies.fidelity), (self.bounded, harmonies.bounded)):
+            array[position + 1:] = array[position:-1]
+            array[position] = new[row]
+        return True
+
+    def _admit_nsga2(self, harmonies, row):
+        if self._fronts is None:
+            self._fronts = self.fronts()
+            self._crowding = self.crowding(self._fronts)
+
+        # The new harmony comes right after the fronts of the harmonies dominating it
+        new, wvalues = harmonies.wvalues[row], self.wvalues
+        dominating = (wvalues >= new).all(axis=1) & (wvalues > new).any(axis=1)
+        front = self._fronts[dominating].max() + 1 if dominating.any() else 0
+
+        # Nothing in the fronts before is dominated by the new harmony, so they are left as they are
+        affected = np.flatnonzero(self._fronts >= front)
+        candidates = Population(np.empty((len(affected) + 1, 0)),
+                                np.vstack((self.fitness[affected], harmonies.fitness[row])))
+        worst = sel_nsga2(candidates, len(candidates))[-1]
+        if worst == len(affected):
+            return False
+
+        replaced = affected[worst]
+        self.masks[replaced] = harmonies.masks[row]
+        self.fitness[replaced] = harmonies.fitness[row]
+        self.fidelity[replaced] = harmonies.fidelity[row]
+        self.bounded[replaced] = harmonies.bounded[row]
+
+        # Removing a harmony of the last front moves no other harmony between fronts
+        local = Population(np.empty((len(affected), 0)), self.fitness[affected])
+        fronts = local.fronts()
+        self._fronts[affected] = front + fronts
+        self._crowding[affected] = local.crowding(fronts)
+        return True
+
+
 class HarmonicSearch(_BaseMetaHeuristic):
     """Implementation of a Harmonic Search Algorithm for Feature Selection
 
@@ -26,6 +119,11 @@ class HarmonicSearch(_BaseMetaHeuristic):
 
     size_pop : positive integer, (default=50)
             Size of the Harmonic Memory 
+
+    batch_size : positive integer, (default=1)
+            Number of harmonies improvised at each generation. They are
+            evaluated together, so with ``parallel`` or an ``executor`` they
+            run concurrently, and they enter the memory in a single sorting of it
     
     sorting_method: one of {'best', 'NSGA2', 'SPEA2'}, (default='NSGA2')
              How to sort the population in order to choose the Elite solutions
@@ -47,8 +145,27 @@ class HarmonicSearch(_BaseMetaHeuristic):
     repeat : positive int, (default=1)
             Number of times to repeat the fitting process
 
-    parallel : boolean, (default=False)
-            Set to True if you want to use multiprocessors
+    parallel : boolean or WorkerPool, (default=False)
+            Set to True if you want to use multiprocessors.
+            A ``WorkerPool`` can be given to share its processes between fits
+
+    executor : one of {'serial', 'threads', 'processes', 'joblib'}, Executor or None, (default=None)
+            Backend evaluating the solutions. Threads suit estimators that release
+            the GIL (liblinear, BLAS heavy models) and processes the pure python
+            ones. Any ``concurrent.futures.Executor`` or ``WorkerPool`` can also be
+            given. If None, ``parallel`` chooses between 'processes' and 'serial'
+
+    n_jobs : integer or None, (default=None)
+            Number of workers of the executor. If None, all the processors are used
+
+    chunksize : positive integer or None, (default=None)
+            Number of solutions sent to a worker at a time
+
+    precompute_kernel : boolean or 'auto', (default='auto')
+            Whether an SVC or NuSVC with a linear or RBF kernel is trained on
+            precomputed kernels, which each worker keeps as square matrices of
+            the size of the dataset. 'auto' only does it while the matrices of
+            all the workers fit in ``FitnessEvaluator.gram_max_bytes``
 
     make_logbook : boolean, (default=False)
             If True, a logbook from DEAP will be made
@@ -56,6 +173,30 @@ class HarmonicSearch(_BaseMetaHeuristic):
     cv_metric_function : callable, (default=matthews_corrcoef)
             A metric score function as stated in the sklearn http://scikit-learn.org/stable/modules/model_evaluation.html#scoring-parameter
 
+    cache_size : positive integer or None, (default=100000)
+            Maximum number of fitnesses kept in the LRU cache of evaluated masks.
+            If None, the cache grows without bound
+
+    fitness_store : str, FitnessStore or None, (default=None)
+            Persistent storage shared across fits, repetitions and processes. If
+            a path is given, a SQLite ``FitnessStore`` is opened there. Fitnesses
+            are only reused when the dataset, estimator, CV splits and metrics match
+
+    log_sink : str, LogSink or None, (default=None)
+            File where the statistics, hall of fame and Pareto front of each
+            logged generation are appended as soon as they are made, one line
+            of JSON per generation. They are logged even without ``make_logbook``,
+            which then keeps nothing in memory. ``LogSink.read`` reads them back
+
+    racing : boolean or float, (default=False)
+            If True, the cross-validation of a new harmony stops as soon as its
+            score can not beat the worst harmony of the memory. A float sets the
+            number of standard deviations of the fold scores used to bound the
+            remaining folds (2 if True), 0 bounding them by the mean alone.
+            Only available with ``sorting_method='best'``.
+            An abandoned harmony is ranked by the bound of its score, but never
+            enters the hall of fame, the Pareto front nor the statistics
+
     features_metric_function : callable, (default=pow(sum(mask)/(len(mask)*5), 2))
             A function that return a float from the binary mask of features
     
@@ -71,11 +212,15 @@ class HarmonicSearch(_BaseMetaHeuristic):
 
 	.. [3] Zitzler, Laumanns and Thiele, “SPEA 2: Improving the strength Pareto evolutionary algorithm”, 2001.
     """
+    # Sorting methods ranking by the score alone, which give racing its threshold
+    _racing_sorting_methods = ('best',)
+
     def __init__(self, 
                  estimator=None, 
                  HMCR=0.95,
                  number_gen=100, 
                  size_pop=50, 
+                 batch_size=1,
                  sorting_method='NSGA2',
                  skip=10,
                  verbose=0, 
@@ -83,12 +228,21 @@ class HarmonicSearch(_BaseMetaHeuristic):
                  make_logbook=False, 
                  random_state=None, 
                  parallel=False,
-                 cv_metric_function=None):
+                 cv_metric_function=None,
+                 cache_size=100000,
+                 fitness_store=None,
+                 log_sink=None,
+                 executor=None,
+                 n_jobs=None,
+                 chunksize=None,
+                 precompute_kernel='auto',
+                 racing=False):
 
         self.estimator = estimator
         self.number_gen = number_gen
         self.HMCR = HMCR
         self.size_pop = size_pop
+        self.batch_size = batch_size
         self.sorting_method = sorting_method
         self.skip = skip
         self.verbose = verbose
@@ -97,25 +251,28 @@ class HarmonicSearch(_BaseMetaHeuristic):
         self.make_logbook = make_logbook
         self.random_state = random_state
         self.cv_metric_function = cv_metric_function
+        self.cache_size = cache_size
+        self.fitness_store = fitness_store
+        self.log_sink = log_sink
+        self.executor = executor
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.precompute_kernel = precompute_kernel
+        self.racing = racing
         np.random.seed(self.random_state)
 
     def _setup(self, X, y, normalize):
         X, y = super()._setup(X,y,normalize)
 
-        self._toolbox.register("attribute", self._gen_in)
-
-        self._toolbox.register("individual", tools.initIterate,
-                               BaseMask, self._toolbox.attribute)
-
-        self._toolbox.register("population", tools.initRepeat,
-                               list, self._toolbox.individual)
+        # Sorting the memory gives the indexes of the harmonies kept, which the memory tracks as they come
+        self._toolbox.register("population", self._harmony_memory)
 
         if(self.sorting_method == 'best'):
-            self._toolbox.register( "sort", sorted, key=lambda ind: ind.fitness.values[0], reverse=True)
+            self._toolbox.register( "sort", lambda pop: np.argsort(-pop.fitness[:, 0], kind='stable')[:self.size_pop])
         elif(self.sorting_method == 'NSGA2'):
-            self._toolbox.register( "sort", tools.selNSGA2, k=self.size_pop+1)
+            self._toolbox.register( "sort", sel_nsga2, k=self.size_pop)
         elif(self.sorting_method == 'SPEA2'):
-            self._toolbox.register( "sort", tools.selSPEA2, k=self.size_pop+1)
+            self._toolbox.register( "sort", sel_spea2, k=self.size_pop)
         else:
             raise ValueError("The {} sorting method is not valid".format(self.sorting_method))
 
@@ -124,38 +281,40 @@ class HarmonicSearch(_BaseMetaHeuristic):
         if( self.HMCR < 0 or self.HMCR > 1):
             raise ValueError("The HMCR param is {}, but should be in the interval [0,1]".format(self.HMCR))
         
-        self._toolbox.register("mutate", tools.mutFlipBit, indpb=1-self.HMCR)
+        self._toolbox.register("mutate", mut_flip_bit, indpb=1-self.HMCR,
+                               random_state=self._random_object)
 
         return X, y
     def _do_generation(self, harmony_mem, hof, paretoFront):
                 
-        # Improvise a New Harmony
-        new_harmony = self._improvise(harmony_mem)
-        new_harmony.fitness.values = self._toolbox.evaluate(new_harmony)
-        harmony_mem.append(new_harmony)
+        # Improvise New Harmonies
+        new_harmonies = self._improvise(harmony_mem, self.batch_size)
+        if self._racing and self.sorting_method == 'best':
+            # Only a harmony better than the worst one stays in the memory
+            self._race_threshold = harmony_mem.fitness[:, 0].min()
+        self._evaluate_population(new_harmonies)
+        self._race_threshold = None
 
-        # Remove the Worst Harmony
-        harmony_mem = self._toolbox.sort(harmony_mem)
-        harmony_mem.pop()
+        # The worst harmonies give their place to better new ones
+        harmony_mem.admit(new_harmonies)
 
-        # Log statistic
-        hof.update(harmony_mem)
-        paretoFront.update(harmony_mem)
+        # Log statistic, the harmonies of the memory were already offered to them
+        hof.update(new_harmonies)
+        paretoFront.update(new_harmonies)
 
         return harmony_mem, hof, paretoFront
 
-    def _improvise(self, pop):
-        """ Function that improvise a new harmony"""
-        # HMCR = Harmonic Memory Considering Rate
-        # pylint: disable=E1101
-        new_harmony = self._toolbox.individual()
-
-        rand_list = self._random_object.randint(low=0, high=len(pop),
-                                                size=len(new_harmony))
+    def _harmony_memory(self, n):
+        """ Return a ``HarmonyMemory`` of ``n`` random harmonies"""
+        return HarmonyMemory(self._random_population(n).masks, sorting_method=self.sorting_method,
+                             sort=self._toolbox.sort)
 
-        for i in range(len(new_harmony)):
-            new_harmony[i] = pop[rand_list[i]][i]
-
-        self._toolbox.mutate(new_harmony)
+    def _improvise(self, pop, n=1):
+        """ Function that improvise ``n`` new harmonies"""
+        # HMCR = Harmonic Memory Considering Rate
+        # Each note is taken from a random harmony of the memory
+        n_features = pop.masks.shape[1]
+        rand_list = self._random_object.randint(low=0, high=len(pop), size=(n, n_features))
+        masks = pop.masks[rand_list, np.arange(n_features)]
 
-        return new_harmony
+        return Population(self._toolbox.mutate(masks))
@@ -0,0 +1,81 @@
+""" Streaming of the generation logs to disk during the fit.
+
+Each logged generation is appended to a file as one line of JSON as soon as it
+is made, so the history of a run survives the process, and a long run does
+not need to keep it in memory.
+"""
+import json
+
+import numpy as np
+
+from .snapshot import Snapshot
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("{} is not JSON serializable".format(type(value).__name__))
+
+
+class LogSink(object):
+    """ Append-only file of generation records, in line-delimited JSON.
+
+    A record holds the algorithm, repetition, generation, time and statistics
+    of the generation, and the snapshots of its hall of fame and Pareto front.
+    A snapshot identical to the previous one of the same field is written as
+    null, and ``read`` fills it back.
+
+    Parameters
+    ----------
+    path : str
+            Path of the file, created if needed and appended to otherwise
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._last = {}
+
+    def write(self, record):
+        """ Append the ``record``, a dict, and flush it to the file"""
+        if self._file is None:
+            self._file = open(self.path, 'a')
+
+        line = {}
+        for key, value in record.items():
+            if isinstance(value, Snapshot):
+                last = self._last.get(key)
+                unchanged = last is not None and last.packed is value.packed and last.fitness is value.fitness
+                self._last[key] = value
+                value = None if unchanged else value.to_json()
+            line[key] = value
+
+        self._file.write(json.dumps(line, default=_json_default) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._last = {}
+
+    def __getstate__(self):
+        return {'path': self.path, '_file': None, '_last': {}}
+
+    @staticmethod
+    def read(path):
+        """ Yield the records of the file at ``path``, with their snapshots as ``Snapshot``"""
+        last = {}
+        with open(path) as log_file:
+            for line in log_file:
+                record = json.loads(line)
+                for key in ('hallOfFame', 'paretoFront'):
+                    if key not in record:
+                        continue
+                    if record[key] is None:
+                        record[key] = last[key]
+                    else:
+                        record[key] = last[key] = Snapshot.from_json(record[key])
+                yield record
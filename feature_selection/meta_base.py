@@ -4,8 +4,8 @@ from itertools import compress
 from random import sample
 import random
 import numpy as np
-from sklearn.base import BaseEstimator, MetaEstimatorMixin, TransformerMixin, clone
-from sklearn.model_selection import cross_val_score
+from sklearn.base import BaseEstimator, MetaEstimatorMixin, TransformerMixin, clone, is_classifier
+from sklearn.model_selection import cross_val_score, check_cv, train_test_split
 from sklearn.metrics import matthews_corrcoef
 from sklearn.metrics import make_scorer
 from sklearn.utils.validation import check_array, check_is_fitted, column_or_1d
@@ -21,12 +21,84 @@ import copy
 from timeit import time
 
 from collections import Counter
+
+from .fitness_cache import FitnessCache, FitnessStore, SharedFitnessCache
+from .fitness_cache import fitness_context, mask_digest
+from .evaluation import BoundedFitness, FitnessEvaluator, SubsampleFitness
+from .parallel import WorkerPool, make_backend
+from .surrogate import make_surrogate
+from .population import Population, PopulationStatistics
+from .snapshot import Snapshot
+from .log_sink import LogSink
+
+
 class Fitness(base.Fitness):
 
     def __init__(self, weights=(1, -1e-5), values=(0, 0)):
         self.weights = weights
+        self.fidelity = 1.0
+        self.bounded = False
         super(Fitness, self).__init__(values)
 
+    def setValues(self, values):
+        # Fitnesses computed on a subsample carry the fraction of rows they saw
+        self.fidelity = getattr(values, 'fidelity', 1.0)
+        # and the ones of abandoned masks are only bounds of the score
+        self.bounded = isinstance(values, BoundedFitness)
+        super(Fitness, self).setValues(values)
+
+    def delValues(self):
+        self.fidelity = 1.0
+        self.bounded = False
+        super(Fitness, self).delValues()
+
+    values = property(base.Fitness.getValues, setValues, delValues)
+
+    def __deepcopy__(self, memo):
+        copy_ = super(Fitness, self).__deepcopy__(memo)
+        copy_.fidelity = self.fidelity
+        copy_.bounded = self.bounded
+        return copy_
+
+
+def _full_fidelity(population):
+    """ Keep the fitnesses that are real cross valid scores on the full dataset:
+    neither computed on a subsample nor bounds of masks abandoned by racing.
+    """
+    if isinstance(population, Population):
+        # Each distinct mask once, so duplicates do not hide other candidates
+        rows = np.flatnonzero(population.valid & (population.fidelity >= 1) & ~population.bounded)
+        _, first = np.unique(population.masks[rows], axis=0, return_index=True)
+        return population[rows[np.sort(first)]]
+    return [ind for ind in population if getattr(ind.fitness, 'fidelity', 1.0) >= 1
+            and not getattr(ind.fitness, 'bounded', False)]
+
+
+class HallOfFame(tools.HallOfFame):
+    """ Hall of fame ignoring the fitnesses computed on a subsample.
+
+    From a ``Population``, only the rows that may enter are made individuals.
+    """
+
+    def update(self, population):
+        population = _full_fidelity(population)
+        if isinstance(population, Population):
+            population = population.individuals(population.order()[:self.maxsize])
+        super(HallOfFame, self).update(population)
+
+
+class ParetoFront(tools.ParetoFront):
+    """ Pareto front ignoring the fitnesses computed on a subsample.
+
+    From a ``Population``, only its non dominated rows are made individuals.
+    """
+
+    def update(self, population):
+        population = _full_fidelity(population)
+        if isinstance(population, Population):
+            population = population.individuals(population.nondominated())
+        super(ParetoFront, self).update(population)
+
 
 class BaseMask(list, object):
 
@@ -135,7 +207,8 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
                  verbose=0, repeat=1, parallel=False,
                  make_logbook=False, random_state=None,
                  cv_metric_function=make_scorer(matthews_corrcoef),
-                 ):
+                 cache_size=100000, fitness_store=None,
+                 executor=None, n_jobs=None, chunksize=None, precompute_kernel='auto', log_sink=None):
 
         self.estimator = estimator
         self.number_gen = number_gen
@@ -145,6 +218,13 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
         self.make_logbook = make_logbook
         self.random_state = random_state
         self.cv_metric_function = cv_metric_function
+        self.cache_size = cache_size
+        self.fitness_store = fitness_store
+        self.executor = executor
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.precompute_kernel = precompute_kernel
+        self.log_sink = log_sink
 
         np.random.seed(self.random_state)
 
@@ -157,7 +237,7 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
         ones = np.ones([random_number, ], dtype=int)
         return sample(list(np.concatenate((zeros, ones), axis=0)), self.n_features_)
 
-    def _evaluate(self, individual, X, y, cv=2):
+    def _evaluate(self, individual):
         """ 
             Evaluate method. Each individual is a mask of features.
 
@@ -173,33 +253,207 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
         ----------
         Score of the individual : turple( cross valid score, feature length score)
         """
-        # Select Features
-        features = list(compress(range(len(individual)), individual))
-        train = np.reshape([X[:, i] for i in features],
-                           [len(features), len(X)]).T
+        return self.evaluate_batch([individual])[0]
 
-        if train.shape[1] == 0:
-            return 0, 1,
+    def evaluate_batch(self, masks):
+        """ Return the fitness of each mask of a batch.
 
-        if individual[:] in self._all_solutions:
-            return self.all_solutions[individual[:]] 
+        Masks without features, cache hits and duplicates are resolved in this
+        process, and the remaining unique masks are evaluated in a single round
+        of the executor, so a mask is never fitted twice in a batch.
 
-        # Applying K-Fold Cross Validation
-        accuracies = cross_val_score(estimator=clone(self._estimator), X=train,
-                                     y=y, cv=cv,
-                                     scoring=self.cv_metric_function)
+        Parameters
+        ----------
+        masks : array-like of shape [n_masks, n_features]
+                Binary masks of features, e.g. a list of individuals
 
-        if hasattr(self, 'features_metric_function'):
-            if self.features_metric_function == None:
-                feature_score = sum(individual) / len(individual)
+        Returns
+        -------
+        fitnesses : list of tuples (cross valid score, feature length score)
+        """
+        masks = np.asarray(masks, dtype=bool).reshape(-1, self.n_features_)
+
+        fitnesses = [None] * len(masks)
+        keys = {}
+        first = {}
+        duplicates = []
+        for i, mask in enumerate(masks):
+            if not mask.any():
+                fitnesses[i] = (0, 1)
+                continue
+
+            key = mask_digest(mask)
+            if key in first:
+                duplicates.append((i, first[key]))
+                continue
+
+            first[key] = i
+            keys[i] = key
+            fitnesses[i] = self._fitness_cache.get(key)
+
+        missing = [i for i in keys if fitnesses[i] is None]
+        if missing and self._fidelity_evaluators:
+            missing = self._successive_halving(masks, keys, missing, fitnesses)
+
+        if missing:
+            unique = masks[missing]
+            if self._backend is not None:
+                results = self._backend.evaluate(unique, threshold=self._race_threshold)
             else:
-                feature_score = self.features_metric_function(individual)
-        else:
-            feature_score = sum(individual) / len(individual)
+                results = [self._evaluator(mask, keys[i], self._race_threshold)
+                           for i, mask in zip(missing, unique)]
+            for i, fitness in zip(missing, results):
+                # Raced fitnesses are only bounds of the score
+                if not isinstance(fitness, BoundedFitness):
+                    self._fitness_cache[keys[i]] = fitness
+                fitnesses[i] = fitness
+            self._observe(unique, results)
+
+        for i, j in duplicates:
+            fitnesses[i] = fitnesses[j]
+        if duplicates:
+            self._evaluator.record(duplicate_masks=len(duplicates))
+
+        return fitnesses
+
+    def _evaluate_population(self, individuals):
+        """ Evaluate the ``individuals``, or the rows of a ``Population`` without fitness, as one batch and set their fitness"""
+        if isinstance(individuals, Population):
+            rows = np.flatnonzero(~individuals.valid)
+            individuals.set_fitness(self.evaluate_batch(individuals.masks[rows]), rows)
+            return
+
+        for ind, fit in zip(individuals, self.evaluate_batch(individuals)):
+            ind.fitness.values = fit
+
+    def _random_population(self, n):
+        """ Return a ``Population`` of ``n`` random masks, drawn as ``_gen_in`` does"""
+        return Population.random(n, self.n_features_, self._random_object)
+
+    @staticmethod
+    def _deap_order(population, select, **kwargs):
+        """ Return the indexes of the rows of ``population`` in the order of a DEAP selection"""
+        individuals = population.individuals()
+        for index, individual in enumerate(individuals):
+            individual.index = index
+        return np.array([individual.index for individual in select(individuals, **kwargs)], dtype=int)
+
+    def _evaluation_map(self, evaluate, individuals):
+        """ ``map`` of the toolbox, evaluating the individuals as one batch"""
+        individuals = list(individuals)
+        if evaluate is not self._toolbox.evaluate:
+            return list(map(evaluate, individuals))
+        return self.evaluate_batch(individuals)
+
+    def _observe(self, masks, fitnesses):
+        """ Teach the surrogate the scores of newly evaluated masks"""
+        if self._surrogate is None:
+            return
+
+        observed = [(mask, fitness[0]) for mask, fitness in zip(masks, fitnesses)
+                    if not isinstance(fitness, BoundedFitness)]
+        if observed:
+            masks, scores = zip(*observed)
+            self._surrogate.partial_fit(masks, scores)
+
+    def _screening_factor(self):
+        """ How many candidates to generate per solution that will be evaluated.
+
+        It is ``surrogate_factor`` once the surrogate has seen a population
+        worth of masks, and 1 without surrogate.
+        """
+        if self._surrogate is None or self._surrogate.n_observed < getattr(self, 'size_pop', 1):
+            return 1
+        return self.surrogate_factor
+
+    def _screen(self, candidates, n):
+        """ Keep the ``n`` candidates with the best predicted score.
+
+        Candidates with a valid fitness are ranked by their actual score.
+        """
+        if len(candidates) <= n:
+            return candidates
 
-        self._all_solutions[individual[:]] = (accuracies.mean(), feature_score)  
+        if isinstance(candidates, Population):
+            scores = candidates.fitness[:, 0].copy()
+            unknown = np.flatnonzero(~candidates.valid)
+            masks = candidates.masks[unknown]
+        else:
+            unknown = [i for i, ind in enumerate(candidates) if not ind.fitness.valid]
+            scores = np.array([ind.fitness.values[0] if ind.fitness.valid else np.nan
+                               for ind in candidates])
+            masks = [candidates[i] for i in unknown]
+        if len(unknown):
+            scores[unknown] = self._surrogate.predict(masks)
+
+        best = np.sort(np.argsort(-scores, kind='stable')[:n])
+        self._evaluator.record(screened_out=len(candidates) - n)
+        if isinstance(candidates, Population):
+            return candidates[best]
+        return [candidates[i] for i in best]
+
+    def _successive_halving(self, individuals, keys, candidates, fitnesses):
+        """ Score the ``candidates`` on growing subsamples of the dataset.
+
+        After each subsample, only the best ``promotion_rate`` of the candidates
+        are kept. Their fitnesses are written in ``fitnesses`` and the indexes
+        of the candidates left for the full dataset are returned.
+        """
+        for fidelity, evaluator in self._fidelity_evaluators:
+            for i in candidates:
+                key = keys[i] + np.float64(fidelity).tobytes()
+                fitness = self._fitness_cache.get(key)
+                if fitness is None:
+                    fitness = SubsampleFitness(evaluator(individuals[i], key), fidelity)
+                    self._fitness_cache[key] = fitness
+                fitnesses[i] = fitness
+
+            n_promoted = int(np.ceil(len(candidates) * self.promotion_rate))
+            candidates = sorted(candidates, key=lambda i: fitnesses[i][0], reverse=True)[:n_promoted]
+
+        return sorted(candidates)
+
+    def _make_fidelity_evaluators(self, X, y, n_folds):
+        """ Build an evaluator on a stratified subsample for each of the ``fidelities``"""
+        fidelities = getattr(self, 'fidelities', None)
+        if not fidelities:
+            return []
+
+        promotion_rate = getattr(self, 'promotion_rate', 0.5)
+        if promotion_rate <= 0 or promotion_rate > 1:
+            raise ValueError("The promotion_rate param is {}, but should be in the interval (0,1]".format(promotion_rate))
+
+        classifier = is_classifier(self._estimator)
+        evaluators = []
+        for fidelity in sorted(fidelities):
+            if fidelity <= 0 or fidelity >= 1:
+                raise ValueError("The fidelities should be in the interval (0,1), got {}".format(fidelity))
+
+            rows, _ = train_test_split(np.arange(X.shape[0]), train_size=fidelity,
+                                       stratify=y if classifier else None,
+                                       random_state=self.random_state)
+            X_sub, y_sub = X[rows], y[rows]
+            cv = min(n_folds, min(Counter(y_sub).values())) if classifier else n_folds
+            if cv < 2:
+                raise ValueError("The subsample of fidelity {} has a class with less than 2 samples".format(fidelity))
+
+            cv = list(check_cv(cv, y_sub, classifier=classifier).split(X_sub, y_sub))
+            evaluators.append((fidelity, FitnessEvaluator(
+                self._estimator, X_sub, y_sub, cv, scoring=self.cv_metric_function,
+                features_metric_function=getattr(self, 'features_metric_function', None),
+                precompute_kernel=getattr(self, 'precompute_kernel', 'auto'), n_workers=self._n_workers)))
+
+        return evaluators
+
+    def cache_info(self):
+        """ Return the statistics of the fitness cache of the last fit
 
-        return accuracies.mean(), feature_score
+        Returns
+        -------
+        info : CacheInfo(hits, misses, maxsize, currsize)
+        """
+        check_is_fitted(self, '_fitness_cache')
+        return self._fitness_cache.info()
 
     def predict(self, X):
         if not hasattr(self, "classes_"):
@@ -293,23 +547,24 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
 
         if 'stats' in self_dict:
             del self_dict['stats']
-        
+
+        # The cache is only useful during fit and can hold a lot of entries
+        if '_fitness_cache' in self_dict:
+            self_dict['_fitness_cache'] = FitnessCache(0)
+
+        # The evaluator holds a copy of the dataset and the backend holds processes
+        for key in ('_evaluator', '_fidelity_evaluators', '_backend', '_log_sink'):
+            if key in self_dict:
+                del self_dict[key]
+
         return self_dict
 
     def __setstate__(self, state):
         self.__dict__.update(state)
 
     def _make_stats(self):
-        stats_fit = tools.Statistics(key=lambda ind: ind.fitness.values[0])
-        stats_size = tools.Statistics(key=sum)
-        self.stats = tools.MultiStatistics(fitness=stats_fit, size=stats_size)
-        self.stats.register("avg", np.mean)
-        self.stats.register("std", np.std)
-        self.stats.register("min", np.min)
-        self.stats.register("max", np.max)
-        self.stats.register("25_percentile", np.percentile, q=25, interpolation='higher')
-        self.stats.register("50_percentile", np.percentile, q=50, interpolation='higher')
-        self.stats.register("75_percentile", np.percentile, q=75, interpolation='higher')
+        # avg, std, min, max and the quartiles of the score and of the number of features
+        self.stats = PopulationStatistics()
         self.logbook = [tools.Logbook() for i in range(self.repeat)]
 
         for i in range(self.repeat):
@@ -350,8 +605,9 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
         self.normalize_ = normalize
 
         y = self._validate_targets(y)
+        # Fortran order keeps each feature contiguous for the evaluations
         X, y = check_X_y(X, y, dtype=np.float64,
-                         order='C', accept_sparse='csr')
+                         order='F', accept_sparse='csr')
 
         self.n_features_ = X.shape[1]
 
@@ -363,12 +619,22 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
         pass
 
     def _make_generation_log(self, gen, repetition, pop, hof, pareto_front):
-        self.i_gen_pareto_.append(copy.deepcopy(pareto_front))
-        self.i_gen_hof_.append(copy.deepcopy(hof))
+        # The logbook, the generation lists and the sink share compact snapshots, which reuse the previous one if nothing changed
+        hof_snapshot = Snapshot(hof, self._last_snapshots[0])
+        pareto_snapshot = Snapshot(pareto_front, self._last_snapshots[1])
+        self._last_snapshots = hof_snapshot, pareto_snapshot
 
         record = self.stats.compile(pop)
+        clock = time.clock()
+
+        if self.make_logbook:
+            self.i_gen_pareto_.append(pareto_snapshot)
+            self.i_gen_hof_.append(hof_snapshot)
+            self.logbook[repetition].record(gen=gen, hallOfFame=hof_snapshot, paretoFront=pareto_snapshot, time=clock, **record)
 
-        self.logbook[repetition].record(gen=gen, hallOfFame=copy.deepcopy(hof), paretoFront=copy.deepcopy(pareto_front), time=time.clock(), **record)
+        if self._log_sink is not None:
+            self._log_sink.write(dict(algorithm=type(self).__name__, repetition=repetition, gen=gen,
+                                      time=clock, hallOfFame=hof_snapshot, paretoFront=pareto_snapshot, **record))
 
         if self.verbose:
             self._toolbox.print("*********    Report {}       ************* ".format(type(self).__name__), end='\n\n')
@@ -386,6 +652,7 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
             self._toolbox.print()
 
     def _make_repetition_log(self, hof, pareto_front):
+        self._last_snapshots = None, None
         self.best_.update(hof)
         self.best_pareto_front_.update(pareto_front)
         if self.make_logbook:
@@ -399,9 +666,13 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
     def _setup(self, X, y, normalize):
         " Initialize the toolbox and statistical variables"
 
-        if(hasattr(self, '_all_solutions')):
-            del self._all_solutions
-        self._all_solutions = dict()
+        # Nothing is held yet, in case a check below fails and ``_teardown`` runs
+        self._backend = self._shared_cache = self._evaluator = None
+        self._fitness_store = self._log_sink = None
+        self._fidelity_evaluators = []
+
+        cache_size = getattr(self, 'cache_size', 100000)
+        self._fitness_cache = FitnessCache(cache_size)
 
         if(not hasattr(self, "_toolbox")):
             self._toolbox = base.Toolbox()
@@ -414,14 +685,34 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
         else:
             self._toolbox.register("print", print)
 
-        if self.parallel:
-            from multiprocessing import Pool
-            self._toolbox.register("map", Pool().map)
+        executor = getattr(self, 'executor', None)
+        if executor is None:
+            if isinstance(self.parallel, WorkerPool):
+                executor = self.parallel
+            else:
+                executor = 'processes' if self.parallel else 'serial'
+        self._backend, self._owns_backend = make_backend(
+            executor, getattr(self, 'n_jobs', None), getattr(self, 'chunksize', None))
+        # Each worker keeps its own kernel matrices
+        self._n_workers = 1 if self._backend is None else self._backend.n_workers
+
+        if self._backend is not None and self._backend.multiprocess:
+            # The workers only see the fitnesses of each other through shared memory
+            self._shared_cache = SharedFitnessCache(
+                cache_size if cache_size is not None else 100000)
         else:
-            self._toolbox.register("map", map)
+            self._shared_cache = None
 
-        if self.make_logbook:
+        self._log_sink = None
+        log_sink = getattr(self, 'log_sink', None)
+        if log_sink is not None:
+            self._log_sink = LogSink(log_sink) if isinstance(log_sink, str) else log_sink
+        self._last_snapshots = None, None
+
+        if self.make_logbook or self._log_sink is not None:
             self._make_stats()
+
+        if self.make_logbook:
             self.pareto_front_ = []
             self.hof_ = []
             self.gen_hof_ = []
@@ -437,8 +728,8 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
         self._random_object = check_random_state(self.random_state)
         np.random.seed(self.random_state)
 
-        self.best_ = tools.HallOfFame(1)
-        self.best_pareto_front_ = tools.ParetoFront()
+        self.best_ = HallOfFame(1)
+        self.best_pareto_front_ = ParetoFront()
 
         self._toolbox.register('clone', copy.deepcopy)
 
@@ -452,15 +743,97 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
         # Check the number of members in each class:
         min_n_classes =  min(Counter(y).values())
         if( min_n_classes >= 5  ):
-            self._toolbox.register("evaluate", self._evaluate, X=X, y=y, cv=5)
+            cv = 5
         else :
             print(" Be carefull, this dataset has not enough samples to use CV=5. CV=2  set instead")
-            self._toolbox.register("evaluate", self._evaluate, X=X, y=y, cv=2)
+            cv = 2
+
+        # The splits are fixed for the whole fit, so the fitness of a mask is deterministic
+        cv = list(check_cv(cv, y, classifier=is_classifier(self._estimator)).split(X, y))
+
+        self._fitness_store = None
+        self._fitness_context = None
+        if getattr(self, 'fitness_store', None) is not None:
+            if isinstance(self.fitness_store, str):
+                self._fitness_store = FitnessStore(self.fitness_store)
+            else:
+                self._fitness_store = self.fitness_store
+            self._fitness_context = fitness_context(
+                X, y, self._estimator, cv, self.cv_metric_function,
+                getattr(self, 'features_metric_function', None))
+
+        # Set by the algorithms around the evaluations that fold racing may cut
+        self._race_threshold = None
+        racing = getattr(self, 'racing', False)
+        # A margin of 0 still races, on the mean of the fold scores alone
+        self._racing = racing is not None and racing is not False
+        race_margin = 2.0 if isinstance(racing, bool) or racing is None else float(racing)
+        if race_margin < 0:
+            raise ValueError("The racing param is {}, but should be a boolean or a non negative float".format(racing))
+        sorting_methods = getattr(self, '_racing_sorting_methods', ())
+        if self._racing and getattr(self, 'sorting_method', None) not in sorting_methods:
+            raise ValueError("Racing needs a sorting_method in {}, got {}".format(
+                sorting_methods, getattr(self, 'sorting_method', None)))
+
+        self._evaluator = FitnessEvaluator(
+            self._estimator, X, y, cv, scoring=self.cv_metric_function,
+            features_metric_function=getattr(self, 'features_metric_function', None),
+            shared_cache=self._shared_cache, store=self._fitness_store,
+            context=self._fitness_context,
+            precompute_kernel=getattr(self, 'precompute_kernel', 'auto'),
+            race_margin=race_margin, n_workers=self._n_workers)
+        self._fidelity_evaluators = self._make_fidelity_evaluators(X, y, len(cv))
+
+        self._surrogate = make_surrogate(getattr(self, 'surrogate', None))
+        if self._surrogate is not None and self.surrogate_factor < 1:
+            raise ValueError("The surrogate_factor param is {}, but should be at least 1".format(self.surrogate_factor))
+        self._toolbox.register("evaluate", self._evaluate)
+
+        if self._backend is not None:
+            self._backend.bind(self._evaluator)
+        self._toolbox.register("map", self._evaluation_map)
         
         # This array are suppose to store the unbiased estimations of the quality of each solution if X_test and y_test are given
         self.unbiased_scalar = []
         return X, y
 
+    def _teardown(self):
+        """ Release the resources acquired by ``_setup``, even if it stopped
+        half way or did not start
+        """
+
+        # Stores given by path are owned by this fit
+        if isinstance(getattr(self, 'fitness_store', None), str) and getattr(self, '_fitness_store', None) is not None:
+            self._fitness_store.close()
+        if isinstance(getattr(self, 'log_sink', None), str) and getattr(self, '_log_sink', None) is not None:
+            self._log_sink.close()
+
+        # Executors given by the user are kept alive for their next fits
+        if getattr(self, '_backend', None) is not None:
+            if self._owns_backend:
+                self._backend.close()
+            else:
+                self._backend.release()
+        self._backend = None
+
+        if getattr(self, '_evaluator', None) is None:
+            if getattr(self, '_shared_cache', None) is not None:
+                self._shared_cache.close()
+            self._shared_cache = None
+            return
+
+        self._evaluator.release()
+        self.evaluation_stats_ = dict(self._evaluator.stats)
+        self.schedule_log_ = list(self._evaluator.schedule_log)
+        for fidelity, evaluator in self._fidelity_evaluators:
+            self.evaluation_stats_['subsample_evaluations'] = (
+                self.evaluation_stats_.get('subsample_evaluations', 0) + evaluator.stats['evaluations'])
+
+        if self._shared_cache is not None:
+            self._evaluator.shared_cache = None
+            self._shared_cache.close()
+            self._shared_cache = None
+
     def best_pareto(self):
         return self.best_pareto_front_
 
@@ -501,45 +874,45 @@ class _BaseMetaHeuristic(BaseEstimator, SelectorMixin, MetaEstimatorMixin):
         """
         
 
-        X,y = self._setup(X, y, normalize)
+        try:
+            X,y = self._setup(X, y, normalize)
 
-        self.set_params(**arg)
-        
-        self._initial_time = time.clock()
-        for i in range(self.repeat):
+            self.set_params(**arg)
 
-            pop = self._toolbox.population(n=self.size_pop)
-            
-            fitnesses = self._toolbox.map(self._toolbox.evaluate, pop)
-            for ind, fit in zip(pop, fitnesses): 
-                ind.fitness.values = fit            
+            self._initial_time = time.clock()
+            for i in range(self.repeat):
+
+                pop = self._toolbox.population(n=self.size_pop)
+                self._evaluate_population(pop)
             
-            hof = tools.HallOfFame(1)
-            hof.update(pop)
-            pareto_front = tools.ParetoFront()
-            pareto_front.update(pop)
+                hof = HallOfFame(1)
+                hof.update(pop)
+                pareto_front = ParetoFront()
+                pareto_front.update(pop)
 
-            for g in range(self.number_gen):
+                for g in range(self.number_gen):
 
-                pop, hof, pareto_front = self._do_generation( pop, hof, pareto_front)
+                    pop, hof, pareto_front = self._do_generation( pop, hof, pareto_front)
 
-                if self._skip == 0 or g % self._skip == 0:
-                    if self.make_logbook:
-                        self._make_generation_log(g, i, pop, hof, pareto_front)
+                    if self._skip == 0 or g % self._skip == 0:
+                        if self.make_logbook or self._log_sink is not None:
+                            self._make_generation_log(g, i, pop, hof, pareto_front)
 
-                if self.verbose and not self.make_logbook:
-                    self._toolbox.print( "Generation: ", g, " Repetition: ", i, " Clock:", time.clock() - self._initial_time)
+                    if self.verbose and not self.make_logbook:
+                        self._toolbox.print( "Generation: ", g, " Repetition: ", i, " Clock:", time.clock() - self._initial_time)
 
-                if time_limit is not None and time.clock() - self._initial_time > time_limit:
-                    break
+                    if time_limit is not None and time.clock() - self._initial_time > time_limit:
+                        break
                 
-                # Unbiased estimation of the algorithm 
-                if not (X_test is None) and not( y_test is None):
-                    self._estimator.fit(X=self.transform(X), y=y)
-                    score = self.cv_metric_function(self._estimator,X_test, y_test)
-                    self.unbiased_scalar.append(score)
-
-            self._make_repetition_log(hof, pareto_front)
+                    # Unbiased estimation of the algorithm 
+                    if not (X_test is None) and not( y_test is None):
+                        self._estimator.fit(X=self.transform(X), y=y)
+                        score = self.cv_metric_function(self._estimator,X_test, y_test)
+                        self.unbiased_scalar.append(score)
+
+                self._make_repetition_log(hof, pareto_front)
+        finally:
+            self._teardown()
 
         self._estimator.fit(X=self.transform(X), y=y)
 
@@ -0,0 +1,485 @@
+""" Backends for the parallel evaluation of masks.
+
+The dataset is put in shared memory, the evaluator is sent to each worker
+once, and the tasks only carry masks packed into bits. The masks are dispatched one at
+a time from the most to the least expensive, as predicted by the cost model
+of the evaluator, so a few large masks do not hold up a generation.
+"""
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+import os
+import pickle
+import time
+import uuid
+
+import numpy as np
+
+# Evaluator of the current process, set by the pool initializer or loaded
+# from the ``EvaluatorHandle`` whose token is kept
+_worker_evaluator = None
+_worker_token = None
+
+
+def attach_shared_memory(name):
+    """ Attach to an existing shared memory block without claiming its ownership"""
+    from multiprocessing import shared_memory
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+
+    # Before python 3.13 attaching also registers the block in the resource
+    # tracker of this process, which would free it when a worker exits
+    from multiprocessing import resource_tracker
+
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedArray(object):
+    """ Numpy array copied into shared memory and pickled by name.
+
+    Parameters
+    ----------
+    array : numpy array
+    """
+
+    def __init__(self, array):
+        from multiprocessing import shared_memory
+
+        array = np.asarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.order = 'F' if array.flags.f_contiguous and not array.flags.c_contiguous else 'C'
+        self._shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self._owner = True
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf, order=self.order)
+        self.array[...] = array
+
+    def close(self):
+        """ Detach from the shared memory block. The owner also frees it."""
+        if self._shm is None:
+            return
+        self.array = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+        self._shm = None
+
+    def __getstate__(self):
+        if self._shm is None:
+            raise ValueError("The shared array is closed")
+        return {'shape': self.shape, 'dtype': self.dtype, 'order': self.order,
+                'name': self._shm.name}
+
+    def __setstate__(self, state):
+        self.shape = state['shape']
+        self.dtype = state['dtype']
+        self.order = state['order']
+        self._shm = attach_shared_memory(state['name'])
+        self._owner = False
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf, order=self.order)
+
+
+class EvaluatorHandle(object):
+    """ Evaluator pickled once into shared memory, for the workers of any executor.
+
+    Pickling the handle only sends the name of the block. Each worker loads
+    the evaluator on its first task and keeps it for the next ones, as the
+    initializer of a ``WorkerPool`` does, which an executor made by the user
+    can not be given afterwards.
+
+    Parameters
+    ----------
+    evaluator : FitnessEvaluator
+            Evaluator whose dataset is already shared
+    """
+
+    def __init__(self, evaluator):
+        self.token = uuid.uuid4().hex
+        self._payload = SharedArray(np.frombuffer(pickle.dumps(evaluator, pickle.HIGHEST_PROTOCOL),
+                                                  dtype=np.uint8))
+        self._name = self._payload._shm.name
+        self._size = self._payload.shape[0]
+
+    def load(self):
+        """ Return the evaluator of this process, unpickling it on the first call"""
+        global _worker_evaluator, _worker_token
+        if _worker_token != self.token:
+            shm = attach_shared_memory(self._name)
+            try:
+                _worker_evaluator = pickle.loads(bytes(shm.buf[:self._size]))
+            finally:
+                shm.close()
+            _worker_token = self.token
+        return _worker_evaluator
+
+    def close(self):
+        """ Free the block, and the evaluator loaded by this process if any"""
+        global _worker_evaluator, _worker_token
+        if _worker_token == self.token:
+            _worker_evaluator = _worker_token = None
+        if self._payload is not None:
+            self._payload.close()
+            self._payload = None
+
+    def __getstate__(self):
+        return {'token': self.token, '_payload': None, '_name': self._name, '_size': self._size}
+
+
+class CostModel(object):
+    """ Linear model of the time to evaluate a mask from its number of selected features.
+
+    It is fitted by least squares on the evaluations timed so far. Until two
+    different sizes are seen, the cost is taken as proportional to the size.
+    """
+
+    def __init__(self):
+        # n, sum(k), sum(k^2), sum(t), sum(k*t)
+        self._sums = np.zeros(5)
+
+    def update(self, n_selected, seconds):
+        """ Add the evaluation times of masks with ``n_selected`` features"""
+        k = np.asarray(n_selected, dtype=float)
+        t = np.asarray(seconds, dtype=float)
+        self._sums += (k.size, k.sum(), (k * k).sum(), t.sum(), (k * t).sum())
+
+    def predict(self, n_selected):
+        """ Return the expected evaluation time of masks with ``n_selected`` features"""
+        k = np.asarray(n_selected, dtype=float)
+        n, sum_k, sum_kk, sum_t, sum_kt = self._sums
+        variance = n * sum_kk - sum_k ** 2
+        if n < 2 or variance <= 0:
+            return k
+
+        slope = (n * sum_kt - sum_k * sum_t) / variance
+        intercept = (sum_t - slope * sum_k) / n
+        return intercept + max(slope, 0) * k
+
+    def order(self, masks):
+        """ Return the indexes of ``masks`` from the most to the least expensive"""
+        n_selected = np.count_nonzero(np.asarray(masks, dtype=bool), axis=1)
+        return np.argsort(-self.predict(n_selected), kind='stable')
+
+
+def pack_masks(masks):
+    """ Pack each mask into bits, 8 features per byte"""
+    return [np.packbits(np.asarray(mask, dtype=bool)) for mask in masks]
+
+
+def _init_worker(evaluator):
+    global _worker_evaluator, _worker_token
+    _worker_evaluator, _worker_token = evaluator, None
+
+
+def _evaluate_packed(task, threshold=None):
+    index, packed = task
+    return index, _evaluate_with(_worker_evaluator, packed, threshold)
+
+
+def _evaluate_handle(handle, packed, threshold=None):
+    return _evaluate_with(handle.load(), packed, threshold)
+
+
+def _evaluate_with(evaluator, packed, threshold=None):
+    # The counters of the worker go back with the fitness and its timing
+    mask = np.unpackbits(packed, count=evaluator.n_features).astype(bool)
+    fitness, seconds, computed = evaluator.timed(mask, threshold)
+    return fitness, evaluator.pop_stats(), seconds, computed
+
+
+def _evaluate_local(evaluator, mask, threshold=None):
+    # Threads record their counters in the evaluator directly
+    fitness, seconds, computed = evaluator.timed(mask, threshold)
+    return fitness, None, seconds, computed
+
+
+def _gather(evaluator, masks, results, makespan, n_workers):
+    """ Return the fitnesses of ``results``, learning the costs and logging the schedule"""
+    fitnesses = []
+    busy = 0.0
+    sizes, times = [], []
+    for mask, (fitness, stats, seconds, computed) in zip(masks, results):
+        if stats is not None:
+            evaluator.record(**stats)
+        if computed:
+            sizes.append(np.count_nonzero(mask))
+            times.append(seconds)
+        busy += seconds
+        fitnesses.append(fitness)
+
+    evaluator.cost_model.update(sizes, times)
+    idle = max(n_workers * makespan - busy, 0.0)
+    evaluator.record(makespan=makespan, idle_time=idle)
+    evaluator.schedule_log.append({'n_masks': len(fitnesses), 'n_workers': n_workers,
+                                   'makespan': makespan, 'busy_time': busy, 'idle_time': idle})
+    return fitnesses
+
+
+class WorkerPool(object):
+    """ Reusable pool of processes evaluating masks of features.
+
+    The evaluator, and with it the dataset, is loaded once per worker by the
+    pool initializer. All the repetitions of a fit share the workers, and when
+    the pool is given to another fit (e.g. the next grid search candidate) the
+    old workers are stopped before the new ones start, so no process leaks.
+    The pool must be closed, either with ``close`` or by using it as a context
+    manager::
+
+        with WorkerPool(4) as pool:
+            GridSearchCV(HarmonicSearch(parallel=pool), grid).fit(X, y)
+
+    Parameters
+    ----------
+    processes : positive integer or None, (default=None)
+            Number of worker processes. If None, ``os.cpu_count()`` is used
+
+    chunksize : positive integer or None, (default=None)
+            Number of masks sent to a worker at a time. If None, they are sent
+            one by one, so the idle workers take the next most expensive mask
+    """
+
+    multiprocess = True
+
+    def __init__(self, processes=None, chunksize=None):
+        self.processes = processes
+        self.chunksize = chunksize
+        self._pool = None
+        self._evaluator = None
+
+    def bind(self, evaluator):
+        """ Make the workers evaluate with ``evaluator``, restarting them if needed"""
+        if self._pool is not None and evaluator is self._evaluator:
+            return self
+
+        self._shutdown()
+
+        from multiprocessing import Pool
+
+        # The dataset goes to shared memory, so even spawned workers do not copy it
+        evaluator.share()
+        self._pool = Pool(self.processes, initializer=_init_worker, initargs=(evaluator,))
+        self._evaluator = evaluator
+        return self
+
+    def evaluate(self, masks, threshold=None):
+        """ Return the fitness of each mask, computed by the workers"""
+        if self._pool is None:
+            raise ValueError("The pool has no evaluator, call bind first")
+
+        packed = pack_masks(masks)
+        tasks = [(index, packed[index]) for index in self._evaluator.cost_model.order(masks)]
+        results = [None] * len(packed)
+
+        start = time.perf_counter()
+        for index, result in self._pool.imap_unordered(
+                partial(_evaluate_packed, threshold=threshold), tasks, self.chunksize or 1):
+            results[index] = result
+
+        return _gather(self._evaluator, masks, results, time.perf_counter() - start, self.n_workers)
+
+    @property
+    def n_workers(self):
+        return self.processes or os.cpu_count()
+
+    def _shutdown(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self._evaluator = None
+
+    def release(self):
+        """ End a fit. The workers are kept, the next fit binds them again."""
+
+    def close(self):
+        """ Stop the workers. The pool can still be bound again afterwards."""
+        self._shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # Cloning an estimator, as grid search does, must keep the same pool
+        return self
+
+    def __getstate__(self):
+        # Processes can not be pickled, a copy of the pool starts unbound
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['_evaluator'] = None
+        return state
+
+
+class ExecutorBackend(object):
+    """ Evaluation of masks with any ``concurrent.futures.Executor``.
+
+    With a process based executor, the evaluator goes through an
+    ``EvaluatorHandle``, so the chunks of tasks only carry its name.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+
+    chunksize : positive integer or None, (default=None)
+            Number of masks sent to a worker process at a time
+    """
+
+    def __init__(self, executor, chunksize=None):
+        self.executor = executor
+        self.chunksize = chunksize
+        self.multiprocess = not isinstance(executor, ThreadPoolExecutor)
+        self._evaluator = None
+        self._handle = None
+
+    def bind(self, evaluator):
+        self.release()
+        if self.multiprocess:
+            self._handle = EvaluatorHandle(evaluator.share())
+        self._evaluator = evaluator
+        return self
+
+    def evaluate(self, masks, threshold=None):
+        order = self._evaluator.cost_model.order(masks)
+        start = time.perf_counter()
+        if self.multiprocess:
+            packed = pack_masks(masks)
+            ordered = self.executor.map(partial(_evaluate_handle, self._handle, threshold=threshold),
+                                        [packed[index] for index in order], chunksize=self.chunksize or 1)
+        else:
+            # Threads share the memory, the masks are used as they are
+            ordered = self.executor.map(partial(_evaluate_local, self._evaluator, threshold=threshold),
+                                        [masks[index] for index in order])
+
+        results = [None] * len(order)
+        for index, result in zip(order, ordered):
+            results[index] = result
+
+        return _gather(self._evaluator, masks, results, time.perf_counter() - start, self.n_workers)
+
+    @property
+    def n_workers(self):
+        return getattr(self.executor, '_max_workers', 1)
+
+    def release(self):
+        """ Free the evaluator sent to the workers, keeping the executor"""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        self._evaluator = None
+
+    def close(self):
+        self.release()
+        self.executor.shutdown()
+
+
+class JoblibBackend(object):
+    """ Evaluation of masks with ``joblib.Parallel`` (loky processes by default).
+
+    The evaluator goes through an ``EvaluatorHandle``, so the workers, which
+    joblib reuses from one call to the next, load it once.
+
+    Parameters
+    ----------
+    n_jobs : integer or None, (default=None)
+            Number of jobs. If None, all the processors are used
+
+    chunksize : positive integer or None, (default=None)
+            Batch size of joblib. If None, it is chosen automatically
+    """
+    multiprocess = True
+
+    def __init__(self, n_jobs=None, chunksize=None):
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self._evaluator = None
+        self._handle = None
+
+    def bind(self, evaluator):
+        self.release()
+        self._handle = EvaluatorHandle(evaluator.share())
+        self._evaluator = evaluator
+        return self
+
+    def evaluate(self, masks, threshold=None):
+        from joblib import Parallel, delayed
+
+        n_jobs = self.n_jobs if self.n_jobs is not None else -1
+        parallel = Parallel(n_jobs=n_jobs, batch_size=self.chunksize or 'auto')
+        packed = pack_masks(masks)
+        order = self._evaluator.cost_model.order(masks)
+
+        start = time.perf_counter()
+        ordered = parallel(delayed(_evaluate_handle)(self._handle, packed[index], threshold)
+                           for index in order)
+
+        results = [None] * len(order)
+        for index, result in zip(order, ordered):
+            results[index] = result
+
+        return _gather(self._evaluator, masks, results, time.perf_counter() - start, self.n_workers)
+
+    @property
+    def n_workers(self):
+        from joblib import effective_n_jobs
+
+        return effective_n_jobs(self.n_jobs if self.n_jobs is not None else -1)
+
+    def release(self):
+        """ Free the evaluator sent to the workers"""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        self._evaluator = None
+
+    def close(self):
+        self.release()
+
+
+def make_backend(executor, n_jobs=None, chunksize=None):
+    """ Build the evaluation backend of an ``executor`` parameter.
+
+    Parameters
+    ----------
+    executor : one of {'serial', 'threads', 'processes', 'joblib'}, WorkerPool or Executor
+
+    n_jobs : integer or None, (default=None)
+            Number of workers of the backends made here
+
+    chunksize : positive integer or None, (default=None)
+            Number of masks sent to a worker at a time
+
+    Returns
+    -------
+    backend : object with ``bind``, ``evaluate(masks, threshold=None)``, ``release``, ``close``
+            and ``n_workers``, or None if serial
+
+    owned : boolean
+            If True, the backend was made here and must be closed by the caller
+    """
+    if isinstance(executor, WorkerPool):
+        return executor, False
+    if isinstance(executor, Executor):
+        return ExecutorBackend(executor, chunksize), False
+
+    if executor == 'serial':
+        return None, False
+    elif executor == 'threads':
+        return ExecutorBackend(ThreadPoolExecutor(n_jobs)), True
+    elif executor == 'processes':
+        return WorkerPool(n_jobs, chunksize), True
+    elif executor == 'joblib':
+        return JoblibBackend(n_jobs, chunksize), True
+    else:
+        raise ValueError("Unknown executor: {}".format(executor))
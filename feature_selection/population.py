@@ -0,0 +1,341 @@
+""" Populations of masks held as a matrix.
+
+A ``Population`` keeps the masks as the rows of a boolean matrix, with the
+fitness and fidelity of each row in parallel arrays, so the variation
+operators run over the whole population at once. DEAP individuals are only
+made when one is needed, e.g. to enter the hall of fame.
+"""
+from bisect import bisect_left
+
+import numpy as np
+
+from .evaluation import BoundedFitness, SubsampleFitness
+
+
+class Population(object):
+    """ Masks of features as rows of a matrix, with their fitness.
+
+    Parameters
+    ----------
+    masks : array-like of shape [n_masks, n_features]
+            Binary masks of features
+
+    fitness : array of shape [n_masks, 2] or None, (default=None)
+            (cross valid score, feature length score) of each mask. NaN marks
+            a mask not evaluated yet
+
+    fidelity : array of shape [n_masks] or None, (default=None)
+            Fraction of the rows of the dataset each fitness was computed on
+
+    bounded : boolean array of shape [n_masks] or None, (default=None)
+            Whether each fitness is only the bound of a mask abandoned by fold
+            racing. Such rows are ranked, but are not reported as results
+    """
+    weights = np.array([1, -1e-5])
+
+    def __init__(self, masks, fitness=None, fidelity=None, bounded=None):
+        self.masks = np.asarray(masks, dtype=bool)
+        if self.masks.ndim != 2:
+            raise ValueError("The masks should be a 2-D array, got {} dimensions".format(self.masks.ndim))
+
+        n_masks = self.masks.shape[0]
+        self.fitness = np.full((n_masks, 2), np.nan) if fitness is None else np.asarray(fitness, dtype=float)
+        self.fidelity = np.ones(n_masks) if fidelity is None else np.asarray(fidelity, dtype=float)
+        self.bounded = np.zeros(n_masks, dtype=bool) if bounded is None else np.asarray(bounded, dtype=bool)
+
+    @classmethod
+    def random(cls, n_masks, n_features, random_state):
+        """ Make masks selecting a uniform number of features, at random places"""
+        n_selected = random_state.randint(1, n_features + 1, size=n_masks)
+        masks = np.arange(n_features) < n_selected[:, np.newaxis]
+        order = np.argsort(random_state.rand(n_masks, n_features), axis=1)
+        return cls(np.take_along_axis(masks, order, axis=1))
+
+    @classmethod
+    def concatenate(cls, populations):
+        return cls(np.concatenate([pop.masks for pop in populations]),
+                   np.concatenate([pop.fitness for pop in populations]),
+                   np.concatenate([pop.fidelity for pop in populations]),
+                   np.concatenate([pop.bounded for pop in populations]))
+
+    def __len__(self):
+        return self.masks.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.individual(index)
+        return Population(self.masks[index], self.fitness[index], self.fidelity[index], self.bounded[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.individual(index)
+
+    @property
+    def valid(self):
+        """ Whether each mask has been evaluated"""
+        return ~np.isnan(self.fitness[:, 0])
+
+    @property
+    def wvalues(self):
+        return self.fitness * self.weights
+
+    def set_fitness(self, fitnesses, rows=None):
+        """ Set the fitness of the ``rows``, all of them by default, from a list of tuples"""
+        rows = np.arange(len(self)) if rows is None else rows
+        fitnesses = list(fitnesses)
+        if len(fitnesses) == 0:
+            return
+        self.fitness[rows] = [tuple(fitness) for fitness in fitnesses]
+        self.fidelity[rows] = [getattr(fitness, 'fidelity', 1.0) for fitness in fitnesses]
+        self.bounded[rows] = [isinstance(fitness, BoundedFitness) for fitness in fitnesses]
+
+    def invalidate(self, rows):
+        self.fitness[rows] = np.nan
+        self.fidelity[rows] = 1.0
+        self.bounded[rows] = False
+
+    def order(self):
+        """ Return the indexes of the rows from the best to the worst fitness.
+
+        Fitnesses are compared as DEAP does, lexicographically on the weighted
+        values, and ties keep the order of the rows.
+        """
+        wvalues = self.wvalues
+        return np.lexsort((np.arange(len(self)), -wvalues[:, 1], -wvalues[:, 0]))
+
+    def ranks(self):
+        """ Return the position of each row in ``order``, 0 being the best"""
+        ranks = np.empty(len(self), dtype=int)
+        ranks[self.order()] = np.arange(len(self))
+        return ranks
+
+    def nondominated(self):
+        """ Return the indexes of the rows no other row dominates"""
+        return np.flatnonzero(self.fronts() == 0)
+
+    def fronts(self):
+        """ Return the Pareto front of each row, 0 being the non dominated one.
+
+        With two objectives the rows sorted by the first one join, in turn, the
+        first front none of whose members dominates them, so a binary search
+        over the last member of each front places them in O(N log N).
+        """
+        wvalues = self.wvalues
+        fronts = np.empty(len(self), dtype=int)
+        # Keys of the last member of each front. Sorted, since a front is dominated by the previous one
+        lasts = []
+        for index in np.lexsort((-wvalues[:, 1], -wvalues[:, 0])):
+            # A row is dominated by a front whose last member has a larger key
+            key = (-wvalues[index, 1], -wvalues[index, 0])
+            front = bisect_left(lasts, key)
+            if front == len(lasts):
+                lasts.append(key)
+            else:
+                lasts[front] = key
+            fronts[index] = front
+        return fronts
+
+    def crowding(self, fronts=None):
+        """ Return the NSGA2 crowding distance of each row within its front.
+
+        As in DEAP, the rows are sorted on each objective in turn, so ties keep
+        the order of the previous objective.
+        """
+        fronts = self.fronts() if fronts is None else fronts
+        n_objectives = self.fitness.shape[1]
+        distances = np.zeros(len(self))
+        for front in np.unique(fronts):
+            ordered = np.flatnonzero(fronts == front)
+            for objective in range(n_objectives):
+                ordered = ordered[np.argsort(self.fitness[ordered, objective], kind='stable')]
+                values = self.fitness[ordered, objective]
+                distances[ordered[[0, -1]]] = np.inf
+                norm = n_objectives * (values[-1] - values[0])
+                if norm != 0:
+                    distances[ordered[1:-1]] += (values[2:] - values[:-2]) / norm
+        return distances
+
+    def individual(self, index, cls=None):
+        """ Return the row ``index`` as a DEAP individual, a ``BaseMask`` by default"""
+        if cls is None:
+            from .meta_base import BaseMask
+            cls = BaseMask
+
+        individual = cls(self.masks[index].astype(int).tolist())
+        if not np.isnan(self.fitness[index, 0]):
+            fitness = tuple(float(value) for value in self.fitness[index])
+            if self.bounded[index]:
+                fitness = BoundedFitness(fitness)
+            elif self.fidelity[index] < 1:
+                fitness = SubsampleFitness(fitness, float(self.fidelity[index]))
+            individual.fitness.values = fitness
+        return individual
+
+    def individuals(self, rows=None):
+        """ Return the ``rows``, all of them by default, as DEAP individuals"""
+        rows = range(len(self)) if rows is None else rows
+        return [self.individual(index) for index in rows]
+
+
+class PopulationStatistics(object):
+    """ Statistics of the scores and the sizes of the masks of a population.
+
+    ``compile`` returns the record of a generation, as DEAP's ``MultiStatistics``
+    made it, with a 'fitness' and a 'size' chapter of ``fields``. The scores and
+    sizes are read once, as two rows of an array, and all the percentiles come
+    from a single ``np.percentile`` call. As before, a percentile is the next
+    higher value of the population, so the sizes stay integers. The bounds of
+    the masks abandoned by fold racing are left out, unless nothing else is left.
+    """
+    fields = ["avg", "std", "min", "max", "25_percentile", "50_percentile", "75_percentile"]
+    percentiles = [25, 50, 75]
+
+    def compile(self, population):
+        if isinstance(population, Population):
+            reported = population[~population.bounded] if population.bounded.any() else population
+            values = np.vstack((reported.fitness[:, 0], reported.masks.sum(axis=1)))
+        else:
+            reported = [ind for ind in population if not getattr(ind.fitness, 'bounded', False)] or population
+            values = np.array([[ind.fitness.values[0] for ind in reported],
+                               [sum(ind) for ind in reported]], dtype=float)
+
+        try:
+            percentiles = np.percentile(values, self.percentiles, axis=1, method='higher')
+        except TypeError:
+            # numpy older than 1.22
+            percentiles = np.percentile(values, self.percentiles, axis=1, interpolation='higher')
+        columns = np.vstack((values.mean(axis=1), values.std(axis=1), values.min(axis=1),
+                             values.max(axis=1), percentiles))
+
+        fitness = dict(zip(self.fields, columns[:, 0]))
+        size = dict(zip(self.fields[:2], columns[:2, 1]))
+        size.update(zip(self.fields[2:], columns[2:, 1].astype(int)))
+        return {'fitness': fitness, 'size': size}
+
+
+def sel_tournament(population, k, tournsize, random_state):
+    """ Return the indexes of ``k`` winners of tournaments of ``tournsize`` random rows"""
+    aspirants = random_state.randint(0, len(population), size=(k, tournsize))
+    ranks = population.ranks()[aspirants]
+    return aspirants[np.arange(k), np.argmin(ranks, axis=1)]
+
+
+def sel_best(population, k):
+    """ Return the indexes of the ``k`` best rows"""
+    return population.order()[:k]
+
+
+def sel_nsga2(population, k):
+    """ Return the indexes of the ``k`` best rows by Pareto front, then by crowding distance.
+
+    They are the rows DEAP's ``selNSGA2`` chooses, in the order of their ranks.
+    """
+    fronts = population.fronts()
+    return np.lexsort((-population.crowding(fronts), fronts))[:k]
+
+
+def sel_spea2(population, k):
+    """ Return the indexes of the ``k`` rows chosen by the SPEA2 environmental selection.
+
+    The strength of a row is the number of rows it dominates, and its raw
+    fitness the sum of the strengths of the rows dominating it. The non
+    dominated rows, of raw fitness 0, are chosen first. If there are fewer than
+    ``k`` of them, the others follow by raw fitness, ties broken by the density
+    around them: 1 / (2 + the distance to their sqrt(N)-th nearest row). If
+    there are more, the row closest to the others, comparing the sorted
+    distances lexicographically, is removed until ``k`` are left.
+    Distances are on the unweighted fitness, as in DEAP's ``selSPEA2``.
+    """
+    wvalues, values = population.wvalues, population.fitness
+    n_rows = len(population)
+    dominates = ((wvalues[:, np.newaxis, :] >= wvalues[np.newaxis, :, :]).all(axis=2)
+                 & (wvalues[:, np.newaxis, :] > wvalues[np.newaxis, :, :]).any(axis=2))
+    raw_fitness = dominates.T.astype(int) @ dominates.sum(axis=1)
+    chosen = np.flatnonzero(raw_fitness == 0)
+
+    if len(chosen) < k:
+        distances = np.sqrt(((values[:, np.newaxis, :] - values[np.newaxis, :, :]) ** 2).sum(axis=2))
+        np.fill_diagonal(distances, np.inf)
+        nearest = min(int(np.sqrt(n_rows)), n_rows - 1)
+        kth_distance = np.partition(distances, nearest - 1, axis=1)[:, nearest - 1] if nearest > 0 else np.zeros(n_rows)
+        others = np.flatnonzero(raw_fitness > 0)
+        fitness = raw_fitness[others] + 1 / (kth_distance[others] + 2)
+        return np.concatenate((chosen, others[np.argsort(fitness, kind='stable')[:k - len(chosen)]]))
+
+    if len(chosen) > k:
+        points = values[chosen]
+        distances = ((points[:, np.newaxis, :] - points[np.newaxis, :, :]) ** 2).sum(axis=2)
+        np.fill_diagonal(distances, np.inf)
+        # Each row sorted once; a removed row leaves a column per row, so the remaining ones stay sorted
+        order = np.argsort(distances, axis=1, kind='stable')
+        sorted_distances = np.take_along_axis(distances, order, axis=1)
+        alive = np.ones(len(chosen), dtype=bool)
+        while np.count_nonzero(alive) > k:
+            rows = np.flatnonzero(alive)
+            kept = sorted_distances[rows][alive[order[rows]]].reshape(len(rows), -1)
+            # The lexicographically smallest distances, the first row on ties
+            candidates = np.arange(len(rows))
+            for column in range(kept.shape[1]):
+                column_values = kept[candidates, column]
+                candidates = candidates[column_values == column_values.min()]
+                if len(candidates) == 1:
+                    break
+            alive[rows[candidates[0]]] = False
+        chosen = chosen[alive]
+
+    return chosen
+
+
+def sel_roulette(population, k, random_state):
+    """ Return the indexes of ``k`` rows drawn with a probability proportional to their score"""
+    scores = np.clip(population.fitness[:, 0], 0, None)
+    total = scores.sum()
+    p = scores / total if total > 0 else None
+    return random_state.choice(len(population), size=k, p=p)
+
+
+def cx_uniform(first, second, indpb, random_state):
+    """ Return the two children of uniform crossovers of the paired rows.
+
+    Each gene is exchanged between the parents with probability ``indpb``, so
+    the first child takes it from ``second`` and the second from ``first``.
+    ``first`` and ``second`` are matrices of parents, paired by row.
+    """
+    swap = random_state.rand(*first.shape) < indpb
+    return np.where(swap, second, first), np.where(swap, first, second)
+
+
+def cx_one_point(first, second, random_state):
+    """ Return the two children of one point crossovers of the paired rows"""
+    n_features = first.shape[1]
+    points = random_state.randint(1, n_features, size=(first.shape[0], 1))
+    swap = np.arange(n_features) >= points
+    return np.where(swap, second, first), np.where(swap, first, second)
+
+
+def cx_two_point(first, second, random_state):
+    """ Return the two children of two point crossovers of the paired rows"""
+    n_features = first.shape[1]
+    # As DEAP draws them, the two points are distinct, so a segment is always swapped
+    points = np.column_stack((random_state.randint(1, n_features + 1, size=first.shape[0]),
+                              random_state.randint(1, n_features, size=first.shape[0])))
+    points[:, 1] += points[:, 1] >= points[:, 0]
+    points.sort(axis=1)
+    genes = np.arange(n_features)
+    swap = (genes >= points[:, :1]) & (genes < points[:, 1:])
+    return np.where(swap, second, first), np.where(swap, first, second)
+
+
+def mut_flip_bit(masks, indpb, random_state):
+    """ Return the masks with each gene flipped with probability ``indpb``"""
+    return masks ^ (random_state.rand(*masks.shape) < indpb)
+
+
+def mut_binary_uniform(masks, indpb, prob, random_state):
+    """ Return the masks with each gene replaced with probability ``indpb``,
+    by 1 with ``prob`` chance, otherwise 0.
+    """
+    # A single draw: below indpb the gene mutates, and where in [0, indpb) it falls decides its value
+    draw = random_state.rand(*masks.shape)
+    mutated = draw < indpb
+    return np.where(mutated, draw < indpb * prob, masks)
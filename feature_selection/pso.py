@@ -12,19 +12,35 @@ from deap import tools
 from .meta_base import _BaseMetaHeuristic
 from .meta_base import BaseMask
 from .meta_base import *
+from .population import Population
 
-import operator
-import math
 import numpy as np
-import random
 from timeit import time
 
 
-class PSOBaseMask(BaseMask):
-    def __init__(self, mask, speed=None):
-        super(PSOBaseMask, self).__init__(mask)
-        self.best = None
-        self.speed = speed if speed != None else mask.speed
+class Swarm(Population):
+    """ Positions of the particles as a matrix of masks, with their velocities
+    and personal bests as matrices of the same shape.
+    """
+
+    def __init__(self, masks, velocity, fitness=None, fidelity=None, bounded=None):
+        super(Swarm, self).__init__(masks, fitness, fidelity, bounded)
+        self.velocity = np.asarray(velocity, dtype=float)
+        self.best_masks = self.masks.copy()
+        self.best_fitness = np.full((len(self), 2), np.nan)
+
+    def update_best(self):
+        """ Keep the positions fitter than the personal bests, as DEAP compares fitnesses.
+
+        Only the full dataset cross valid scores are compared, so a score on a
+        subsample or the bound of a raced mask never becomes a personal best.
+        """
+        wvalues, best = self.wvalues, self.best_fitness * self.weights
+        improved = (np.isnan(best[:, 0]) | (wvalues[:, 0] > best[:, 0])
+                    | ((wvalues[:, 0] == best[:, 0]) & (wvalues[:, 1] > best[:, 1])))
+        improved &= self.valid & (self.fidelity >= 1) & ~self.bounded
+        self.best_masks[improved] = self.masks[improved]
+        self.best_fitness[improved] = self.fitness[improved]
 
 
 class PSO(_BaseMetaHeuristic):
@@ -60,12 +76,57 @@ class PSO(_BaseMetaHeuristic):
     make_logbook : boolean, (default=False)
             If True, a logbook from DEAP will be made
 
-    parallel : boolean, (default=False)
-            Set to True if you want to use multiprocessors
+    parallel : boolean or WorkerPool, (default=False)
+            Set to True if you want to use multiprocessors.
+            A ``WorkerPool`` can be given to share its processes between fits
+
+    executor : one of {'serial', 'threads', 'processes', 'joblib'}, Executor or None, (default=None)
+            Backend evaluating the solutions. Threads suit estimators that release
+            the GIL (liblinear, BLAS heavy models) and processes the pure python
+            ones. Any ``concurrent.futures.Executor`` or ``WorkerPool`` can also be
+            given. If None, ``parallel`` chooses between 'processes' and 'serial'
+
+    n_jobs : integer or None, (default=None)
+            Number of workers of the executor. If None, all the processors are used
+
+    chunksize : positive integer or None, (default=None)
+            Number of solutions sent to a worker at a time
+
+    precompute_kernel : boolean or 'auto', (default='auto')
+            Whether an SVC or NuSVC with a linear or RBF kernel is trained on
+            precomputed kernels, which each worker keeps as square matrices of
+            the size of the dataset. 'auto' only does it while the matrices of
+            all the workers fit in ``FitnessEvaluator.gram_max_bytes``
 
     cv_metric_function : callable, (default=matthews_corrcoef)
             A metric score function as stated in the sklearn http://scikit-learn.org/stable/modules/model_evaluation.html#scoring-parameter
 
+    cache_size : positive integer or None, (default=100000)
+            Maximum number of fitnesses kept in the LRU cache of evaluated masks.
+            If None, the cache grows without bound
+
+    fitness_store : str, FitnessStore or None, (default=None)
+            Persistent storage shared across fits, repetitions and processes. If
+            a path is given, a SQLite ``FitnessStore`` is opened there. Fitnesses
+            are only reused when the dataset, estimator, CV splits and metrics match
+
+    log_sink : str, LogSink or None, (default=None)
+            File where the statistics, hall of fame and Pareto front of each
+            logged generation are appended as soon as they are made, one line
+            of JSON per generation. They are logged even without ``make_logbook``,
+            which then keeps nothing in memory. ``LogSink.read`` reads them back
+
+    fidelities : list of floats in (0, 1) or None, (default=None)
+            Fractions of the rows of stratified subsamples on which the solutions
+            evaluated together are scored first, from the smallest. After each
+            subsample only the best ``promotion_rate`` of them go on, and only
+            the last survivors are evaluated on the full dataset. Each fitness
+            keeps the fraction it came from in ``fitness.fidelity``, and only
+            full dataset fitnesses enter the hall of fame and the Pareto fronts
+
+    promotion_rate : float in (0, 1], (default=0.5)
+            Fraction of the solutions promoted from one subsample to the next
+
     features_metric_function : callable, (default=pow(sum(mask)/(len(mask)*5), 2))
             A function that return a float from the binary mask of features
     """
@@ -74,7 +135,9 @@ class PSO(_BaseMetaHeuristic):
                  number_gen=10, size_pop=40, verbose=0, repeat=1, slim=1,
                  make_logbook=False, random_state=None, parallel=False,
                  cv_metric_function=None, features_metric_function=None,
-                 print_fnc=None, name="PSO"):
+                 print_fnc=None, name="PSO", cache_size=100000,
+                 fitness_store=None, log_sink=None, executor=None, n_jobs=None, chunksize=None, precompute_kernel='auto',
+                 fidelities=None, promotion_rate=0.5):
 
         self.name = name
         self.estimator = estimator
@@ -85,6 +148,15 @@ class PSO(_BaseMetaHeuristic):
         self.make_logbook = make_logbook
         self.random_state = random_state
         self.cv_metric_function = cv_metric_function
+        self.cache_size = cache_size
+        self.fitness_store = fitness_store
+        self.log_sink = log_sink
+        self.executor = executor
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.precompute_kernel = precompute_kernel
+        self.fidelities = fidelities
+        self.promotion_rate = promotion_rate
         self.features_metric_function = features_metric_function
         self.print_fnc = print_fnc
 
@@ -98,12 +170,9 @@ class PSO(_BaseMetaHeuristic):
 
         X,y = super()._setup(X,y,normalize)
 
-        self._toolbox.register("attribute", self._gen_in)
-        self._toolbox.register("individual", tools.initIterate,
-                              PSOBaseMask, self._toolbox.attribute)
-        self._toolbox.register("population", tools.initRepeat,
-                              list, self._toolbox.individual)
-        
+        # The swarm updates as a whole, from its matrices
+        self._toolbox.register("population", self._swarm)
+
 
         if hasattr(self, 'n_features_') :
             if( self.n_features_ > 4 ):
@@ -113,55 +182,39 @@ class PSO(_BaseMetaHeuristic):
         
         return X, y
 
-    def _gen_in(self):
-        ind=super(PSO, self)._gen_in()
-        speed=[random.uniform(-self.slim, self.slim) for _ in range(len(ind))]
-
-        return PSOBaseMask(ind, speed)
+    def _swarm(self, n):
+        """ Return a ``Swarm`` of ``n`` random particles with random velocities"""
+        pop = self._random_population(n)
+        velocity = self._random_object.uniform(-self.slim, self.slim, size=pop.masks.shape)
+        return Swarm(pop.masks, velocity)
 
-    def updateParticle(self, part, best, phi1, phi2):
+    def _update_swarm(self, swarm, best, phi1, phi2):
+        rng = self._random_object
+        position = swarm.masks.astype(float)
 
         # Update Personal Best
-        if not part.best or part.best.fitness < part.fitness:
-            part.best=self._toolbox.clone(part)
-
-        # Personal Influence
-        u1=(random.uniform(0, phi1) for _ in range(len(part)))
-        v_u1=list(map(operator.mul, u1, map(operator.sub, part.best, part)))
-
-        # Global Influence
-        u2=(random.uniform(0, phi2) for _ in range(len(part)))
-        v_u2=list(map(operator.mul, u2, map(operator.sub, best, part)))
+        swarm.update_best()
 
-        # Computate Speed
-        part.speed[:]=list(map(operator.add, part.speed,
-                              map(operator.add, v_u1, v_u2)))
+        # Personal and Global Influence
+        personal = rng.uniform(0, phi1, size=position.shape) * (swarm.best_masks - position)
+        social = rng.uniform(0, phi2, size=position.shape) * (best - position)
 
-        # Verifiy speed bounds
-        for i, speed in enumerate(part.speed):
-            if speed < - self.slim:
-                part.speed[i]=- self.slim
-            elif speed > self.slim:
-                part.speed[i]=self.slim
+        # Computate Speed, within its bounds
+        np.clip(swarm.velocity + personal + social, -self.slim, self.slim, out=swarm.velocity)
 
         # Update Position
-        rand=[random.random() for _ in range(len(part))]
-        sig=map(self.sigmoid, part.speed)
-        dif=map(operator.add, sig, rand)
-        part[:]=np.round([x*0.5 for x in dif])
+        rand = rng.rand(*position.shape)
+        swarm.masks = np.round((self.sigmoid(swarm.velocity) + rand) * 0.5).astype(bool)
 
         # Delete Fitness
-        del part.fitness.values
+        swarm.invalidate(slice(None))
 
     def _do_generation(self, pop, hof, paretoFront):
         # Update Particles
-        for part in pop:
-            self.updateParticle(part, hof[0], self.phi1, self.phi2)
+        self._update_swarm(pop, np.asarray(hof[0], dtype=float), self.phi1, self.phi2)
 
         # Evaluate the entire population
-        fitnesses=self._toolbox.map( self._toolbox.evaluate, pop)
-        for ind, fit in zip(pop, fitnesses):
-            ind.fitness.values=fit
+        self._evaluate_population(pop)
 
         # Log statistic
         hof.update(pop)
@@ -174,4 +227,4 @@ class PSO(_BaseMetaHeuristic):
         return -np.log(1/x - 1)
 
     def sigmoid(self, x):
-        return 1 / (1 + math.exp(-x*self._sigmoid_coeff))
+        return 1 / (1 + np.exp(-x*self._sigmoid_coeff))
@@ -38,8 +38,27 @@ class RandomSearch(_BaseMetaHeuristic):
     repeat : positive int, (default=1)
             Number of times to repeat the fitting process
 
-    parallel : boolean, (default=False)
-            Set to True if you want to use multiprocessors
+    parallel : boolean or WorkerPool, (default=False)
+            Set to True if you want to use multiprocessors.
+            A ``WorkerPool`` can be given to share its processes between fits
+
+    executor : one of {'serial', 'threads', 'processes', 'joblib'}, Executor or None, (default=None)
+            Backend evaluating the solutions. Threads suit estimators that release
+            the GIL (liblinear, BLAS heavy models) and processes the pure python
+            ones. Any ``concurrent.futures.Executor`` or ``WorkerPool`` can also be
+            given. If None, ``parallel`` chooses between 'processes' and 'serial'
+
+    n_jobs : integer or None, (default=None)
+            Number of workers of the executor. If None, all the processors are used
+
+    chunksize : positive integer or None, (default=None)
+            Number of solutions sent to a worker at a time
+
+    precompute_kernel : boolean or 'auto', (default='auto')
+            Whether an SVC or NuSVC with a linear or RBF kernel is trained on
+            precomputed kernels, which each worker keeps as square matrices of
+            the size of the dataset. 'auto' only does it while the matrices of
+            all the workers fit in ``FitnessEvaluator.gram_max_bytes``
 
     make_logbook: boolean, (default=False)
             If True, a logbook from DEAP will be made
@@ -47,6 +66,43 @@ class RandomSearch(_BaseMetaHeuristic):
     cv_metric_function : callable, (default=matthews_corrcoef)
             A metric score function as stated in the sklearn http://scikit-learn.org/stable/modules/model_evaluation.html#scoring-parameter
 
+    cache_size : positive integer or None, (default=100000)
+            Maximum number of fitnesses kept in the LRU cache of evaluated masks.
+            If None, the cache grows without bound
+
+    fitness_store : str, FitnessStore or None, (default=None)
+            Persistent storage shared across fits, repetitions and processes. If
+            a path is given, a SQLite ``FitnessStore`` is opened there. Fitnesses
+            are only reused when the dataset, estimator, CV splits and metrics match
+
+    log_sink : str, LogSink or None, (default=None)
+            File where the statistics, hall of fame and Pareto front of each
+            logged generation are appended as soon as they are made, one line
+            of JSON per generation. They are logged even without ``make_logbook``,
+            which then keeps nothing in memory. ``LogSink.read`` reads them back
+
+    fidelities : list of floats in (0, 1) or None, (default=None)
+            Fractions of the rows of stratified subsamples on which the solutions
+            evaluated together are scored first, from the smallest. After each
+            subsample only the best ``promotion_rate`` of them go on, and only
+            the last survivors are evaluated on the full dataset. Each fitness
+            keeps the fraction it came from in ``fitness.fidelity``, and only
+            full dataset fitnesses enter the hall of fame and the Pareto fronts
+
+    promotion_rate : float in (0, 1], (default=0.5)
+            Fraction of the solutions promoted from one subsample to the next
+
+    surrogate : None, 'ridge' or sklearn regressor, (default=None)
+            Model of the score learned from the bits of the evaluated masks. If
+            given, ``surrogate_factor`` times more new solutions are generated
+            and only the ones with the best predicted score are evaluated.
+            'ridge' is a ridge regression updated with each evaluation, and a
+            regressor (e.g. a random forest) is trained again every generation
+
+    surrogate_factor : integer, (default=3)
+            Number of solutions generated per evaluated one when ``surrogate``
+            is given
+
     features_metric_function : callable, (default=pow(sum(mask)/(len(mask)*5), 2))
             A function that return a float from the binary mask of features
     """
@@ -56,7 +112,10 @@ class RandomSearch(_BaseMetaHeuristic):
                  repeat=1,
                  parallel=False, make_logbook=False, random_state=None,
                  cv_metric_function=None, features_metric_function=None,
-                 print_fnc=None, name="RandomSearch"):
+                 print_fnc=None, name="RandomSearch", cache_size=100000,
+                 fitness_store=None, log_sink=None, executor=None, n_jobs=None, chunksize=None, precompute_kernel='auto',
+                 fidelities=None, promotion_rate=0.5,
+                 surrogate=None, surrogate_factor=3):
         
         self.name = name
         self.estimator = estimator
@@ -67,7 +126,19 @@ class RandomSearch(_BaseMetaHeuristic):
         self.make_logbook = make_logbook
         self.random_state = random_state
         self.cv_metric_function = cv_metric_function
+        self.cache_size = cache_size
+        self.fitness_store = fitness_store
+        self.log_sink = log_sink
+        self.executor = executor
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.precompute_kernel = precompute_kernel
+        self.fidelities = fidelities
+        self.promotion_rate = promotion_rate
+        self.surrogate = surrogate
+        self.surrogate_factor = surrogate_factor
         self.features_metric_function = features_metric_function
+        self.print_fnc = print_fnc
 
         self.size_pop = size_pop
         self.parallel = parallel
@@ -76,22 +147,18 @@ class RandomSearch(_BaseMetaHeuristic):
 
         X, y= super()._setup(X,y,normalize)
 
-        self._toolbox.register("attribute", self._gen_in)
-        self._toolbox.register("individual", tools.initIterate,
-                              BaseMask, self._toolbox.attribute)
-        self._toolbox.register("population", tools.initRepeat,
-                              list, self._toolbox.individual)
+        # The masks are the rows of a matrix
+        self._toolbox.register("population", self._random_population)
         
         return X, y
 
         
     def _do_generation(self, pop, hof, paretoFront):
-        pop = self._toolbox.population(n=self.size_pop)
+        pop = self._toolbox.population(n=self.size_pop * self._screening_factor())
+        pop = self._screen(pop, self.size_pop)
 
         # Evaluate the entire population
-        fitnesses = self._toolbox.map(self._toolbox.evaluate, pop)
-        for ind, fit in zip(pop, fitnesses):
-            ind.fitness.values = fit
+        self._evaluate_population(pop)
 
         # Log statistic
         hof.update(pop)
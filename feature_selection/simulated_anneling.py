@@ -58,8 +58,27 @@ class SimulatedAnneling(_BaseMetaHeuristic):
     repeat : positive int, (default=1)
             Number of times to repeat the fitting process
 
-    parallel : boolean, (default=False)
-            Set to True if you want to use multiprocessors
+    parallel : boolean or WorkerPool, (default=False)
+            Set to True if you want to use multiprocessors.
+            A ``WorkerPool`` can be given to share its processes between fits
+
+    executor : one of {'serial', 'threads', 'processes', 'joblib'}, Executor or None, (default=None)
+            Backend evaluating the solutions. Threads suit estimators that release
+            the GIL (liblinear, BLAS heavy models) and processes the pure python
+            ones. Any ``concurrent.futures.Executor`` or ``WorkerPool`` can also be
+            given. If None, ``parallel`` chooses between 'processes' and 'serial'
+
+    n_jobs : integer or None, (default=None)
+            Number of workers of the executor. If None, all the processors are used
+
+    chunksize : positive integer or None, (default=None)
+            Number of solutions sent to a worker at a time
+
+    precompute_kernel : boolean or 'auto', (default='auto')
+            Whether an SVC or NuSVC with a linear or RBF kernel is trained on
+            precomputed kernels, which each worker keeps as square matrices of
+            the size of the dataset. 'auto' only does it while the matrices of
+            all the workers fit in ``FitnessEvaluator.gram_max_bytes``
 
     make_logbook : boolean, (default=False)
             If True, a logbook from DEAP will be made
@@ -67,6 +86,21 @@ class SimulatedAnneling(_BaseMetaHeuristic):
     cv_metric_function : callable, (default=matthews_corrcoef)
             A metric score function as stated in the sklearn http://scikit-learn.org/stable/modules/model_evaluation.html#scoring-parameter
 
+    cache_size : positive integer or None, (default=100000)
+            Maximum number of fitnesses kept in the LRU cache of evaluated masks.
+            If None, the cache grows without bound
+
+    fitness_store : str, FitnessStore or None, (default=None)
+            Persistent storage shared across fits, repetitions and processes. If
+            a path is given, a SQLite ``FitnessStore`` is opened there. Fitnesses
+            are only reused when the dataset, estimator, CV splits and metrics match
+
+    log_sink : str, LogSink or None, (default=None)
+            File where the statistics, hall of fame and Pareto front of each
+            logged generation are appended as soon as they are made, one line
+            of JSON per generation. They are logged even without ``make_logbook``,
+            which then keeps nothing in memory. ``LogSink.read`` reads them back
+
 
     References  
     ----------
@@ -85,7 +119,14 @@ class SimulatedAnneling(_BaseMetaHeuristic):
                  parallel=False, 
                  make_logbook=False, 
                  random_state=None,
-                 cv_metric_function=None):
+                 cv_metric_function=None,
+                 cache_size=100000,
+                 fitness_store=None,
+                 log_sink=None,
+                 executor=None,
+                 n_jobs=None,
+                 chunksize=None,
+                 precompute_kernel='auto'):
 
         self.estimator = estimator
         self.number_gen = number_gen
@@ -95,6 +136,13 @@ class SimulatedAnneling(_BaseMetaHeuristic):
         self.make_logbook = make_logbook
         self.random_state = random_state
         self.cv_metric_function = cv_metric_function
+        self.cache_size = cache_size
+        self.fitness_store = fitness_store
+        self.log_sink = log_sink
+        self.executor = executor
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.precompute_kernel = precompute_kernel
 
         self.mutation_prob = mutation_prob
         self.initial_temp = initial_temp
@@ -135,50 +183,52 @@ class SimulatedAnneling(_BaseMetaHeuristic):
 
         """
         
-        X, y = self._setup(X, y, normalize)
-        self._initial_time = time.clock()
-        self.set_params(**arg)
-        
+        try:
+            X, y = self._setup(X, y, normalize)
+            self._initial_time = time.clock()
+            self.set_params(**arg)
 
-        for i in range(self.repeat):
-            solution = self._toolbox.individual()
-            hof = tools.HallOfFame(1)
-            pareto_front = tools.ParetoFront()
+            for i in range(self.repeat):
+                solution = self._toolbox.individual()
+                hof = HallOfFame(1)
+                pareto_front = ParetoFront()
 
-            # Evaluate the solution
-            solution.fitness.values = self._toolbox.evaluate(solution)
+                # Evaluate the solution
+                self._evaluate_population([solution])
 
-            g = 0
-            for temp in np.arange(self.initial_temp, 0,
-                                  - self.initial_temp/self.number_gen):
+                g = 0
+                for temp in np.arange(self.initial_temp, 0,
+                                      - self.initial_temp/self.number_gen):
 
-                for _ in range(self.repetition_schedule):
+                    for _ in range(self.repetition_schedule):
 
-                    prev_solution = copy.deepcopy(solution)
-                    self._toolbox.mutate(solution)
-                    solution.fitness.values = self._toolbox.evaluate(solution)
+                        prev_solution = copy.deepcopy(solution)
+                        self._toolbox.mutate(solution)
+                        self._evaluate_population([solution])
 
-                    if prev_solution.fitness > solution.fitness:
-                        solution = self._metropolis_criterion(
-                            solution, prev_solution, temp)
+                        if prev_solution.fitness > solution.fitness:
+                            solution = self._metropolis_criterion(
+                                solution, prev_solution, temp)
 
-                    # Log statistic
-                    hof.update([solution])
-                    pareto_front.update([solution])
+                        # Log statistic
+                        hof.update([solution])
+                        pareto_front.update([solution])
 
-                    g = g+1
+                        g = g+1
 
-                    if self.skip == 0 or g % self.skip == 0:
-                        if self.make_logbook:
-                            self._make_generation_log(g, i, [solution], hof, pareto_front)
+                        if self.skip == 0 or g % self.skip == 0:
+                            if self.make_logbook or self._log_sink is not None:
+                                self._make_generation_log(g, i, [solution], hof, pareto_front)
 
-                        if self.verbose and not self.make_logbook:
-                            self._print(temp, _, i, self._initial_time, time.clock())
+                            if self.verbose and not self.make_logbook:
+                                self._print(temp, _, i, self._initial_time, time.clock())
                 
-                    if time_limit is not None and time.clock() - self._initial_time > time_limit:
-                        break
+                        if time_limit is not None and time.clock() - self._initial_time > time_limit:
+                            break
 
-            self._make_repetition_log(hof, pareto_front)
+                self._make_repetition_log(hof, pareto_front)
+        finally:
+            self._teardown()
 
         self._estimator.fit(X=self.transform(X), y=y)
 
@@ -0,0 +1,92 @@
+""" Compact copies of the halls of fame and Pareto fronts logged each generation.
+
+A ``Snapshot`` keeps the masks of the members as packed bits with their
+fitnesses in an array, instead of a deep copy of the DEAP objects. When the
+members did not change since the previous generation, the arrays of the
+previous snapshot are shared, so a pickled estimator stores them once.
+"""
+import numpy as np
+
+from .population import Population
+
+
+class Snapshot(object):
+    """ Hall of fame or Pareto front, as it was at one generation.
+
+    It behaves as the original container, which is made again on each access.
+    ``restore`` returns it.
+
+    Parameters
+    ----------
+    container : HallOfFame or ParetoFront
+            The container to copy
+
+    previous : Snapshot or None, (default=None)
+            Snapshot of the previous generation, whose arrays are reused if the
+            members are the same
+    """
+    __slots__ = ('kind', 'maxsize', 'n_features', 'packed', 'fitness')
+
+    def __init__(self, container, previous=None):
+        self.kind = type(container)
+        self.maxsize = getattr(container, 'maxsize', None)
+
+        masks = np.array([list(individual) for individual in container], dtype=bool)
+        self.n_features = masks.shape[1] if masks.ndim == 2 else 0
+        self.packed = np.packbits(masks.reshape(len(container), self.n_features), axis=1)
+        self.fitness = np.array([individual.fitness.values for individual in container],
+                                dtype=float).reshape(len(container), -1)
+
+        if (previous is not None and previous.kind is self.kind
+                and np.array_equal(previous.packed, self.packed)
+                and np.array_equal(previous.fitness, self.fitness)):
+            self.packed, self.fitness = previous.packed, previous.fitness
+
+    def restore(self):
+        """ Return the hall of fame or Pareto front of the snapshot"""
+        container = self.kind() if self.maxsize is None else self.kind(self.maxsize)
+        masks = np.unpackbits(self.packed, axis=1, count=self.n_features)
+        # The members are inserted in their order, as they were sorted already
+        for individual in Population(masks, self.fitness).individuals():
+            container.insert(individual)
+        return container
+
+    def to_json(self):
+        """ Return the snapshot as a dict of JSON types, the masks as hexadecimal strings"""
+        return {'kind': self.kind.__name__, 'maxsize': self.maxsize, 'n_features': self.n_features,
+                'masks': [row.tobytes().hex() for row in self.packed], 'fitness': self.fitness.tolist()}
+
+    @classmethod
+    def from_json(cls, data):
+        """ Return the snapshot of a dict made by ``to_json``"""
+        from . import meta_base
+
+        snapshot = cls.__new__(cls)
+        snapshot.kind = getattr(meta_base, data['kind'])
+        snapshot.maxsize = data['maxsize']
+        snapshot.n_features = data['n_features']
+        snapshot.packed = np.array([bytearray.fromhex(row) for row in data['masks']],
+                                   dtype=np.uint8).reshape(len(data['masks']), -1)
+        snapshot.fitness = np.array(data['fitness'], dtype=float).reshape(len(data['masks']), -1)
+        return snapshot
+
+    def __len__(self):
+        return len(self.fitness)
+
+    def __getitem__(self, index):
+        return self.restore()[index]
+
+    def __iter__(self):
+        return iter(self.restore())
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.restore(), name)
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
@@ -10,6 +10,7 @@ from deap import tools
 from .meta_base import _BaseMetaHeuristic
 from .meta_base import BaseMask
 from .meta_base import *
+from .population import Population, sel_spea2, sel_tournament, cx_uniform, mut_binary_uniform
 
 import random
 
@@ -50,12 +51,60 @@ class SPEA2(_BaseMetaHeuristic):
     make_logbook : boolean, (default=False)
             If True, a logbook from DEAP will be made
 
-    parallel : boolean, (default=False)
-            Set to True if you want to use multiprocessors
+    parallel : boolean or WorkerPool, (default=False)
+            Set to True if you want to use multiprocessors.
+            A ``WorkerPool`` can be given to share its processes between fits
+
+    executor : one of {'serial', 'threads', 'processes', 'joblib'}, Executor or None, (default=None)
+            Backend evaluating the solutions. Threads suit estimators that release
+            the GIL (liblinear, BLAS heavy models) and processes the pure python
+            ones. Any ``concurrent.futures.Executor`` or ``WorkerPool`` can also be
+            given. If None, ``parallel`` chooses between 'processes' and 'serial'
+
+    n_jobs : integer or None, (default=None)
+            Number of workers of the executor. If None, all the processors are used
+
+    chunksize : positive integer or None, (default=None)
+            Number of solutions sent to a worker at a time
+
+    precompute_kernel : boolean or 'auto', (default='auto')
+            Whether an SVC or NuSVC with a linear or RBF kernel is trained on
+            precomputed kernels, which each worker keeps as square matrices of
+            the size of the dataset. 'auto' only does it while the matrices of
+            all the workers fit in ``FitnessEvaluator.gram_max_bytes``
 
     cv_metric_function : callable, (default=matthews_corrcoef)
             A metric score function as stated in the sklearn http://scikit-learn.org/stable/modules/model_evaluation.html#scoring-parameter
 
+    cache_size : positive integer or None, (default=100000)
+            Maximum number of fitnesses kept in the LRU cache of evaluated masks.
+            If None, the cache grows without bound
+
+    fitness_store : str, FitnessStore or None, (default=None)
+            Persistent storage shared across fits, repetitions and processes. If
+            a path is given, a SQLite ``FitnessStore`` is opened there. Fitnesses
+            are only reused when the dataset, estimator, CV splits and metrics match
+
+    log_sink : str, LogSink or None, (default=None)
+            File where the statistics, hall of fame and Pareto front of each
+            logged generation are appended as soon as they are made, one line
+            of JSON per generation. They are logged even without ``make_logbook``,
+            which then keeps nothing in memory. ``LogSink.read`` reads them back
+
+    fidelities : list of floats in (0, 1) or None, (default=None)
+            Fractions of the rows of stratified subsamples on which the solutions
+            evaluated together are scored first, from the smallest. After each
+            subsample only the best ``promotion_rate`` of them go on, and only
+            the last survivors are evaluated on the full dataset. Each fitness
+            keeps the fraction it came from in ``fitness.fidelity``, and only
+            full dataset fitnesses enter the hall of fame and the Pareto fronts
+
+    promotion_rate : float in (0, 1], (default=0.5)
+            Fraction of the solutions promoted from one subsample to the next
+
+    features_metric_function : callable, (default=pow(sum(mask)/(len(mask)*5), 2))
+            A function that return a float from the binary mask of features
+
     References
     ----------
     .. [1]  "Spea2: Improving the strength pareto evolutionary algorithm". ITZLER M. LAUMANNS. 
@@ -76,7 +125,19 @@ class SPEA2(_BaseMetaHeuristic):
                  make_logbook=False, 
                  random_state=None, 
                  parallel=False,
-                 cv_metric_function=None):
+                 cv_metric_function=None,
+                 features_metric_function=None,
+                 print_fnc=None,
+                 name="SPEA2",
+                 cache_size=100000,
+                 fitness_store=None,
+                 log_sink=None,
+                 executor=None,
+                 n_jobs=None,
+                 chunksize=None,
+                 precompute_kernel='auto',
+                 fidelities=None,
+                 promotion_rate=0.5):
 
         self.name = name
         self.estimator = estimator
@@ -87,6 +148,15 @@ class SPEA2(_BaseMetaHeuristic):
         self.make_logbook = make_logbook
         self.random_state = random_state
         self.cv_metric_function = cv_metric_function
+        self.cache_size = cache_size
+        self.fitness_store = fitness_store
+        self.log_sink = log_sink
+        self.executor = executor
+        self.n_jobs = n_jobs
+        self.chunksize = chunksize
+        self.precompute_kernel = precompute_kernel
+        self.fidelities = fidelities
+        self.promotion_rate = promotion_rate
         self.features_metric_function = features_metric_function
         self.print_fnc = print_fnc
 
@@ -101,38 +171,30 @@ class SPEA2(_BaseMetaHeuristic):
 
     def _setup(self, X, y, normalize):
         X, y = super()._setup(X,y,normalize)
-        self._toolbox.register("attribute", self._gen_in)
-        self._toolbox.register("individual", tools.initIterate,
-                              BaseMask, self._toolbox.attribute)
-        self._toolbox.register("population", tools.initRepeat,
-                              list, self._toolbox.individual)
-        self._toolbox.register("mate", tools.cxUniform,
-                              indpb=self.cxUniform_indpb)
-        self._toolbox.register("select", tools.selTournament, tournsize=2)
-        self._toolbox.register("mutate", tools.mutUniformInt, low=0, up=1,
-                              indpb=self.gene_mutation_prob)
+        # The population and the archive are matrices of masks
+        self._toolbox.register("population", self._random_population)
+        self._toolbox.register("mate", cx_uniform, indpb=self.cxUniform_indpb,
+                               random_state=self._random_object)
+        self._toolbox.register("select", sel_tournament, tournsize=2,
+                               random_state=self._random_object)
+        self._toolbox.register("mutate", mut_binary_uniform, prob=0.5,
+                              indpb=self.gene_mutation_prob, random_state=self._random_object)
 
         return X, y
     def _do_generation(self, archive, hof, paretoFront):
 
         # Mating Selection
-        pop = self._toolbox.select(archive, self.size_pop)
-
-        # Clone the selected individuals
-        pop = list(map(self._toolbox.clone, pop))
+        pop = archive[self._toolbox.select(archive, self.size_pop)]
 
         # Apply variation
         pop = self._variation(pop)
 
         # Evaluate the individuals with an invalid fitness
-        invalid_ind = [ind for ind in pop if not ind.fitness.valid]
-        fitnesses = self._toolbox.map(
-            self._toolbox.evaluate, invalid_ind)
-        for ind, fit in zip(invalid_ind, fitnesses):
-            ind.fitness.values = fit
+        self._evaluate_population(pop)
 
         # Environmental Selection
-        archive = tools.selSPEA2(archive + pop, self.archive_size)
+        union = Population.concatenate([archive, pop])
+        archive = union[sel_spea2(union, self.archive_size)]
 
         # Log Statistics
         hof.update(archive)
@@ -141,16 +203,14 @@ class SPEA2(_BaseMetaHeuristic):
         return archive, hof, paretoFront
 
     def _variation(self, offspring):
-        # Apply crossover and mutation on the offspring
-        for child1, child2 in zip(offspring[::2], offspring[1::2]):
-            self._toolbox.mate(child1, child2)
-            del child1.fitness.values
-            del child2.fitness.values
+        # Apply crossover on all the pairs and mutation on the offspring
+        first = np.arange(0, len(offspring) - 1, 2)
+        offspring.masks[first], offspring.masks[first + 1] = self._toolbox.mate(
+            offspring.masks[first], offspring.masks[first + 1])
+        offspring.invalidate(np.concatenate((first, first + 1)))
 
-        for mutant in offspring:
-            if random.random() < self.individual_mut_prob:
-                self._toolbox.mutate(mutant)
-                del mutant.fitness.values
+        mutants = np.flatnonzero(self._random_object.rand(len(offspring)) < self.individual_mut_prob)
+        offspring.masks[mutants] = self._toolbox.mutate(offspring.masks[mutants])
+        offspring.invalidate(mutants)
 
         return offspring
-
@@ -0,0 +1,157 @@
+""" Surrogate models of the fitness, used to pre-screen new masks.
+
+A surrogate learns the cross valid score from the bits of the masks already
+evaluated, so the algorithms can generate more candidates than they evaluate
+and only send the most promising ones to the estimator.
+"""
+import numpy as np
+from sklearn.base import clone
+
+
+class RidgeSurrogate(object):
+    """ Ridge regression of the score on the bits of the mask.
+
+    The model is solved on the smaller of its two forms. While fewer masks than
+    features were evaluated, it is solved in its dual form, on the Gram matrix
+    of the masks, which grows with each batch in O(n_observed * k * n_features)
+    for ``k`` new masks. Once there are more masks than features, the normal
+    equations of the features are made from them and then accumulated batch by
+    batch in O(k * n_features^2). On datasets with ``max_samples`` features or
+    more, the dual form only keeps the last ``max_samples`` masks.
+
+    Either way, the model is solved again only before the first prediction
+    following new evaluations.
+
+    Parameters
+    ----------
+    alpha : float, (default=1.0)
+            Regularization strength
+
+    max_samples : positive integer, (default=2000)
+            Largest side of the matrices solved
+    """
+
+    def __init__(self, alpha=1.0, max_samples=2000):
+        self.alpha = alpha
+        self.max_samples = max_samples
+        self.n_observed = 0
+        # Dual form: the masks kept, their scores and Gram matrix
+        self._masks = None
+        self._scores = None
+        self._kernel = None
+        # Primal form: the normal equations, the last column is the intercept
+        self._gram = None
+        self._target = None
+        self._coef = None
+
+    def partial_fit(self, masks, scores):
+        """ Add the evaluated ``masks`` with their ``scores`` to the model"""
+        # The products of bits are exact in single precision
+        masks = np.asarray(masks, dtype=np.float32)
+        scores = np.asarray(scores, dtype=float)
+        self.n_observed += masks.shape[0]
+        self._coef = None
+
+        if self._gram is not None:
+            self._accumulate(masks, scores)
+            return self
+
+        if self._kernel is None:
+            self._masks, self._scores = masks, scores
+            self._kernel = (masks @ masks.T).astype(float)
+        else:
+            cross = (self._masks @ masks.T).astype(float)
+            self._kernel = np.block([[self._kernel, cross], [cross.T, (masks @ masks.T).astype(float)]])
+            self._masks = np.vstack((self._masks, masks))
+            self._scores = np.concatenate((self._scores, scores))
+
+        n_features = masks.shape[1]
+        if n_features < self.max_samples and len(self._scores) > n_features + 1:
+            # The primal form is the smaller one from now on, and nothing was dropped yet
+            self._gram = np.zeros((n_features + 1, n_features + 1))
+            self._target = np.zeros(n_features + 1)
+            self._accumulate(self._masks, self._scores)
+            self._masks = self._scores = self._kernel = None
+        elif len(self._scores) > self.max_samples:
+            kept = slice(len(self._scores) - self.max_samples, None)
+            self._masks, self._scores = self._masks[kept], self._scores[kept]
+            self._kernel = self._kernel[kept, kept]
+        return self
+
+    def _accumulate(self, masks, scores):
+        design = np.hstack((masks, np.ones((masks.shape[0], 1), dtype=masks.dtype))).astype(float)
+        self._gram += design.T @ design
+        self._target += design.T @ scores
+
+    def _solve_primal(self):
+        penalty = self.alpha * np.eye(self._gram.shape[0])
+        penalty[-1, -1] = 0
+        coef = np.linalg.lstsq(self._gram + penalty, self._target, rcond=None)[0]
+        return coef[:-1], coef[-1]
+
+    def _solve_dual(self):
+        # The intercept is not penalized, so the masks and scores are centered
+        row_means = self._kernel.mean(axis=1)
+        centered = self._kernel - row_means[:, np.newaxis] - row_means + row_means.mean()
+        centered[np.diag_indices_from(centered)] += self.alpha
+        target = self._scores - self._scores.mean()
+        try:
+            dual = np.linalg.solve(centered, target)
+        except np.linalg.LinAlgError:
+            dual = np.linalg.lstsq(centered, target, rcond=None)[0]
+
+        mask_means = self._masks.mean(axis=0, dtype=float)
+        coef = dual @ self._masks - mask_means * dual.sum()
+        return coef, self._scores.mean() - mask_means @ coef
+
+    def predict(self, masks):
+        """ Return the predicted score of each mask"""
+        if self._coef is None:
+            self._coef, self._intercept = self._solve_primal() if self._gram is not None else self._solve_dual()
+
+        masks = np.asarray(masks, dtype=float)
+        return masks @ self._coef + self._intercept
+
+
+class EstimatorSurrogate(object):
+    """ Any sklearn regressor used as surrogate, e.g. a random forest.
+
+    The evaluated masks are kept, and the regressor is trained again on all of
+    them before the first prediction following new evaluations.
+
+    Parameters
+    ----------
+    estimator : sklearn regressor
+    """
+
+    def __init__(self, estimator):
+        self.estimator = estimator
+        self.n_observed = 0
+        self._masks = []
+        self._scores = []
+        self._fitted = None
+
+    def partial_fit(self, masks, scores):
+        """ Add the evaluated ``masks`` with their ``scores`` to the model"""
+        self._masks.extend(np.asarray(masks, dtype=bool))
+        self._scores.extend(np.asarray(scores, dtype=float))
+        self.n_observed += len(masks)
+        self._fitted = None
+        return self
+
+    def predict(self, masks):
+        """ Return the predicted score of each mask"""
+        if self._fitted is None:
+            self._fitted = clone(self.estimator).fit(np.array(self._masks), np.array(self._scores))
+        return self._fitted.predict(np.asarray(masks, dtype=bool))
+
+
+def make_surrogate(surrogate):
+    """ Build the surrogate of a ``surrogate`` parameter: None, 'ridge' or a regressor"""
+    if surrogate is None:
+        return None
+    if isinstance(surrogate, str):
+        if surrogate == 'ridge':
+            return RidgeSurrogate()
+        raise ValueError("Unknown surrogate: {}".format(surrogate))
+    return EstimatorSurrogate(surrogate)
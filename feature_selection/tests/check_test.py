@@ -11,6 +11,9 @@ from feature_selection import SimulatedAnneling
 from feature_selection import BRKGA
 from feature_selection import SPEA2
 from feature_selection import PSO
+from feature_selection import FitnessStore
+from feature_selection import WorkerPool
+from feature_selection import LogSink
 from sklearn.utils.testing import assert_raises
 from sklearn.utils.testing import assert_warns
 import nose.plugins.multiprocess 
@@ -127,6 +130,483 @@ def test_predict():
 
 
 
+def test_fitness_cache():
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+
+    meta = HarmonicSearch(random_state=0, number_gen=2, cache_size=2)
+    meta.fit(X, y, normalize=True)
+
+    mask = meta.best_solution()
+    fitness = meta._toolbox.evaluate(mask)
+    hits = meta.cache_info().hits
+    assert_array_equal(meta._toolbox.evaluate(mask), fitness)
+    assert meta.cache_info().hits == hits + 1
+    assert meta.cache_info().currsize <= 2
+
+def test_fitness_store():
+    import os
+    import tempfile
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+
+    path = os.path.join(tempfile.mkdtemp(), 'fitness.db')
+    meta = RandomSearch(random_state=0, number_gen=2, fitness_store=path)
+    meta.fit(X, y, normalize=True)
+    mask = meta.best_solution()
+    fitness = meta._toolbox.evaluate(mask)
+
+    # Same experiment again: the best mask is read from the store
+    meta = RandomSearch(random_state=0, number_gen=1, fitness_store=path)
+    meta.fit(X, y, normalize=True)
+    n_stored = len(FitnessStore(path))
+    assert_array_equal(meta._toolbox.evaluate(mask), fitness)
+    assert len(FitnessStore(path)) == n_stored
+
+    # Lambdas of the same module only share fitnesses if they compute the same thing
+    from feature_selection.fitness_cache import fitness_context
+    cv = [fold[:2] for fold in meta._evaluator._folds]
+    contexts = [fitness_context(np.asfortranarray(X), y, SVC(), cv, None, function)
+                for function in (lambda mask: mask.mean(), lambda mask: mask.sum(), lambda mask: mask.mean())]
+    assert contexts[0] != contexts[1] and contexts[0] == contexts[2]
+
+def test_worker_pool():
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+
+    with WorkerPool(2) as pool:
+        for metaclass in [RandomSearch, BRKGA]:
+            meta = metaclass(random_state=0, number_gen=2, parallel=pool)
+            meta.fit(X, y, normalize=True)
+            meta.transform(X)
+
+            # The pool is not closed by the fit
+            assert pool._pool is not None
+
+    assert pool._pool is None
+
+def test_population():
+    from functools import partial
+    from feature_selection.population import (Population, cx_one_point, cx_two_point,
+                                              cx_uniform, mut_flip_bit, sel_tournament)
+    from feature_selection.meta_base import HallOfFame, ParetoFront
+    rng = np.random.RandomState(0)
+    pop = Population.random(20, 30, rng)
+    assert pop.masks.shape == (20, 30) and pop.masks.any(axis=1).all()
+    assert not pop.valid.any()
+
+    pop.set_fitness([(i / 20., pop.masks[i].mean()) for i in range(20)])
+    assert pop.order()[0] == 19
+    assert (pop.fitness[sel_tournament(pop, 50, 3, rng), 0] >= 2 / 20.).all()
+
+    first, second = pop.masks[:10], pop.masks[10:]
+    for cross_over in (partial(cx_uniform, indpb=0.5), cx_one_point, cx_two_point):
+        child1, child2 = cross_over(first, second, random_state=rng)
+        assert ((child1 == first) | (child1 == second)).all()
+        assert (child1.sum(axis=1) + child2.sum(axis=1) == first.sum(axis=1) + second.sum(axis=1)).all()
+    assert (mut_flip_bit(first, 0, rng) == first).all()
+    # Two distinct points always swap a segment, the end included as in DEAP
+    ones, zeros = np.ones((1000, 2), dtype=bool), np.zeros((1000, 2), dtype=bool)
+    assert (cx_two_point(ones, zeros, rng)[0][:, 1] == 0).all()
+
+    hof, pareto = HallOfFame(2), ParetoFront()
+    hof.update(pop)
+    pareto.update(pop)
+    assert hof[0] == pop.masks[19].astype(int).tolist()
+    assert len(pareto) == len(pop.nondominated())
+
+def test_cost_model():
+    from feature_selection.parallel import CostModel
+    model = CostModel()
+    masks = np.eye(4, dtype=bool).repeat(2, axis=0)
+    masks[6:, :] = True
+    # Without timings, the masks with more features come first
+    assert list(model.order(masks)[:2]) == [6, 7]
+
+    model.update([1, 10, 20], [0.2, 1.1, 2.1])
+    assert np.allclose(model.predict([30]), 3.1)
+
+def test_executors():
+    import os
+    import pickle
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    from sklearn.model_selection import StratifiedKFold
+    from feature_selection.evaluation import FitnessEvaluator
+    from feature_selection.parallel import EvaluatorHandle
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+
+    with ThreadPoolExecutor(2) as executor, ProcessPoolExecutor(2) as processes:
+        for backend in ['serial', 'threads', 'processes', 'joblib', executor, processes]:
+            meta = BRKGA(random_state=0, number_gen=2, executor=backend, n_jobs=2)
+            meta.fit(X, y, normalize=True)
+            assert meta.transform(X).shape[1] == sum(meta.best_solution())
+            if backend != 'serial':
+                assert all(log['idle_time'] >= 0 for log in meta.schedule_log_)
+                assert meta.evaluation_stats_['makespan'] > 0
+
+    # The tasks carry the name of the evaluator in shared memory, not the evaluator
+    evaluator = FitnessEvaluator(SVC(), X, y, list(StratifiedKFold(3).split(X, y))).share()
+    handle = EvaluatorHandle(evaluator)
+    assert len(pickle.dumps(handle)) < 1000 < len(pickle.dumps(evaluator))
+    assert pickle.loads(pickle.dumps(handle)).load().compute(np.ones(X.shape[1], dtype=bool)) == \
+        evaluator.compute(np.ones(X.shape[1], dtype=bool))
+    handle.close()
+    evaluator.release()
+
+    assert_raises(ValueError, BRKGA(executor='gpu').fit, X, y)
+
+    # A fit stopped by a wrong param frees the shared memory it took already
+    if os.path.isdir('/dev/shm'):
+        blocks = set(os.listdir('/dev/shm'))
+        assert_raises(ValueError, BRKGA(executor='processes', racing=-1.0).fit, X, y)
+        assert_raises(ValueError, RandomSearch(executor='joblib', fidelities=[2.0]).fit, X, y)
+        assert set(os.listdir('/dev/shm')) == blocks
+
+def test_precomputed_kernel():
+    from sklearn.model_selection import StratifiedKFold
+    from feature_selection.evaluation import FitnessEvaluator
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target']
+    X = (X - X.mean(axis=0)) / X.std(axis=0)
+    cv = list(StratifiedKFold(3).split(X, y))
+    mask = np.arange(X.shape[1]) % 3 == 0
+
+    for clf in [SVC(kernel='linear'), SVC(), SVC(gamma='auto'), SVC(gamma=0.1)]:
+        gram = FitnessEvaluator(clf, X, y, cv)
+        plain = FitnessEvaluator(clf, X, y, cv, precompute_kernel=False)
+        assert gram._kernel is not None and plain._kernel is None
+        assert np.allclose(gram.compute(mask), plain.compute(mask))
+
+    # The automatic choice keeps the matrices of all the workers in the memory budget
+    n_workers = FitnessEvaluator.gram_max_bytes // (3 * 8 * X.shape[0] ** 2) + 1
+    assert FitnessEvaluator(SVC(), X, y, cv, n_workers=n_workers)._kernel is None
+    assert FitnessEvaluator(SVC(), X, y, cv, precompute_kernel=True, n_workers=n_workers)._kernel == 'rbf'
+    # The Gram matrices kept for the delta updates count in the budget as well
+    evaluator = FitnessEvaluator(SVC(), X, y, cv, n_workers=8)
+    kept = evaluator._delta_capacity + evaluator.gram_buffers - 1
+    assert 8 * kept * 8 * X.shape[0] ** 2 <= FitnessEvaluator.gram_max_bytes
+    meta = BRKGA(precompute_kernel=False, number_gen=1, size_pop=4, elite_size=1, mutant_size=1)
+    assert meta.fit(X, y)._evaluator._kernel is None
+
+def test_delta_gram():
+    from sklearn.model_selection import StratifiedKFold
+    from feature_selection.evaluation import FitnessEvaluator
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target']
+    X = (X - X.mean(axis=0)) / X.std(axis=0)
+    cv = list(StratifiedKFold(3).split(X, y))
+    mask = np.arange(X.shape[1]) % 2 == 0
+    neighbor = mask.copy()
+    neighbor[[0, 1]] = ~neighbor[[0, 1]]
+
+    for clf in [SVC(kernel='linear'), SVC()]:
+        evaluator = FitnessEvaluator(clf, X, y, cv)
+        evaluator.gram(mask)
+        delta = evaluator.gram(neighbor).copy()
+        assert evaluator.stats['delta_evaluations'] == 1
+        assert evaluator.stats['flipped_features'] == 2
+
+        full = FitnessEvaluator(clf, X, y, cv).gram(neighbor)
+        assert np.allclose(delta, full)
+
+def test_racing():
+    from sklearn.model_selection import StratifiedKFold
+    from feature_selection.evaluation import BoundedFitness, FitnessEvaluator
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target']
+    cv = list(StratifiedKFold(5).split(X, y))
+    mask = np.arange(X.shape[1]) < 3
+
+    evaluator = FitnessEvaluator(SVC(kernel='linear'), X, y, cv)
+    full = evaluator(mask, threshold=-1)
+    assert not isinstance(full, BoundedFitness)
+    raced = evaluator(mask, threshold=2)
+    assert isinstance(raced, BoundedFitness) and raced[0] >= full[0]
+    assert evaluator.stats['raced_evaluations'] == 1
+    assert evaluator.stats['saved_fold_fits'] == 3
+
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+    for meta in [BRKGA(sorting_method='simple', size_pop=10, elite_size=2, racing=True),
+                 HarmonicSearch(sorting_method='best', size_pop=5, racing=0.0)]:
+        meta.set_params(random_state=0, number_gen=5)
+        meta.fit(X, y, normalize=True)
+        assert meta.evaluation_stats_['fold_fits'] <= 5 * meta.evaluation_stats_['evaluations']
+        assert meta._racing
+        # The bounds of the abandoned solutions are never reported as scores
+        for ind in meta.best_pareto():
+            assert ind.fitness.values[0] == meta._evaluator.compute(np.asarray(ind, dtype=bool))[0]
+
+    assert_raises(ValueError, BRKGA(racing=-1.0).fit, X, y)
+    # The default sorting methods have no threshold to race against
+    assert_raises(ValueError, BRKGA(racing=True).fit, X, y)
+    assert_raises(ValueError, HarmonicSearch(racing=True).fit, X, y)
+
+def test_fidelities():
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+
+    meta = RandomSearch(fidelities=[0.2, 0.5], size_pop=8, number_gen=2, random_state=0)
+    meta.fit(X, y, normalize=True)
+    stats = meta.evaluation_stats_
+    # 3 batches of 8 solutions: 8 + 4 on the subsamples, 2 on the full dataset
+    assert stats['subsample_evaluations'] <= 3 * 12
+    assert stats['evaluations'] <= 3 * 2
+    assert meta.best_solution().fitness.fidelity == 1
+    assert all(ind.fitness.fidelity == 1 for ind in meta.best_pareto())
+
+    assert_raises(ValueError, RandomSearch(fidelities=[1.5]).fit, X, y)
+    assert_raises(ValueError, RandomSearch(fidelities=[0.5], promotion_rate=0).fit, X, y)
+
+def test_surrogate():
+    from sklearn.ensemble import RandomForestRegressor
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+
+    for surrogate in ['ridge', RandomForestRegressor(n_estimators=10, random_state=0)]:
+        for meta in [RandomSearch(size_pop=6), BRKGA(size_pop=6, elite_size=2, mutant_size=2)]:
+            meta.set_params(surrogate=surrogate, surrogate_factor=4, number_gen=3, random_state=0)
+            meta.fit(X, y, normalize=True)
+            # Once trained, the surrogate discards most of the new solutions
+            assert meta.evaluation_stats_['screened_out'] > 0
+            assert meta.transform(X).shape[1] == sum(meta.best_solution())
+
+    assert_raises(ValueError, RandomSearch(surrogate='tree').fit, X, y)
+
+    # Solved in its dual form, batch by batch, the ridge surrogate is still a ridge regression
+    from sklearn.linear_model import Ridge
+    from feature_selection.surrogate import RidgeSurrogate
+    rng = np.random.RandomState(0)
+    for n_masks, n_features in [(40, 100), (200, 30)]:
+        masks, scores = rng.rand(n_masks, n_features) < 0.3, rng.rand(n_masks)
+        ridge = RidgeSurrogate().partial_fit(masks[:15], scores[:15]).partial_fit(masks[15:], scores[15:])
+        np.testing.assert_allclose(ridge.predict(masks), Ridge().fit(masks, scores).predict(masks))
+    # Beyond max_samples, the dual form only learns from the last masks
+    masks, scores = rng.rand(40, 100) < 0.3, rng.rand(40)
+    ridge = RidgeSurrogate(max_samples=20)
+    for batch in range(4):
+        ridge.partial_fit(masks[batch * 10:(batch + 1) * 10], scores[batch * 10:(batch + 1) * 10])
+    assert ridge._kernel.shape == (20, 20) and ridge.n_observed == 40
+    np.testing.assert_allclose(ridge.predict(masks), Ridge().fit(masks[20:], scores[20:]).predict(masks))
+
+def test_evaluate_batch():
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+    meta = RandomSearch(size_pop=2, number_gen=1, random_state=0).fit(X, y, normalize=True)
+
+    masks = np.zeros((4, X.shape[1]), dtype=bool)
+    masks[:2, :5] = True
+    masks[2, 5:] = True
+    evaluations = meta._evaluator.stats['evaluations']
+    fitnesses = meta.evaluate_batch(masks)
+
+    # The duplicate is fitted once and the empty mask not at all
+    assert meta._evaluator.stats['evaluations'] - evaluations <= 2
+    assert fitnesses[0] == fitnesses[1]
+    assert tuple(fitnesses[3]) == (0, 1)
+
+def test_genetic_operators():
+    from feature_selection.population import mut_binary_uniform
+    rng = np.random.RandomState(0)
+    masks = np.zeros((200, 100), dtype=bool)
+    mutated = mut_binary_uniform(masks, 1, 0.2, rng)
+    assert abs(mutated.mean() - 0.2) < 0.02
+    assert (mut_binary_uniform(masks, 0, 1, rng) == masks).all()
+
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+    for cross_over_type in ('uniform', 'onePoint', 'twoPoint'):
+        for selection_method in ('tournament', 'roullete', 'NSGA2', 'best'):
+            meta = GeneticAlgorithm(size_pop=6, number_gen=2, random_state=0,
+                                    cross_over_type=cross_over_type,
+                                    selection_method=selection_method)
+            meta.fit(X, y, normalize=True)
+            assert meta.transform(X).shape[1] == sum(meta.best_solution())
+
+def test_pso_swarm():
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+    meta = PSO(size_pop=5, number_gen=3, random_state=0).fit(X, y, normalize=True)
+
+    swarm = meta._toolbox.population(n=4)
+    swarm.set_fitness([(0.5, 0.1), (0.2, 0.1), (0.5, 0.2), (0.9, 0.3)])
+    swarm.update_best()
+    best = swarm.best_masks.copy()
+    swarm.set_fitness([(0.6, 0.1), (0.1, 0.1), (0.5, 0.1), (0.9, 0.3)])
+    swarm.masks = ~swarm.masks
+    swarm.update_best()
+    # Only the fitter particles move their personal best
+    assert (swarm.best_masks[:3:2] == swarm.masks[:3:2]).all()
+    assert (swarm.best_masks[1::2] == best[1::2]).all()
+    assert (np.abs(swarm.velocity) <= meta.slim).all()
+
+    # The scores on a subsample are not compared with the full dataset ones
+    from feature_selection.evaluation import SubsampleFitness
+    best = swarm.best_masks.copy()
+    swarm.masks = ~swarm.masks
+    swarm.set_fitness([SubsampleFitness((1.0, 0.1), 0.1)] * 4)
+    swarm.update_best()
+    assert (swarm.best_masks == best).all()
+
+def test_black_hole_update():
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+    meta = BinaryBlackHole(size_pop=5, number_gen=2, random_state=0).fit(X, y, normalize=True)
+
+    blackhole = np.zeros(X.shape[1], dtype=bool)
+    blackhole[:3] = True
+    galaxy = meta._toolbox.population(n=10)
+    galaxy.masks[:] = blackhole
+    assert (meta._dist(galaxy.masks, blackhole) == 0).all()
+
+    # Stars falling on the black hole are all regenerated, and must be evaluated again
+    meta._updateStar(galaxy, blackhole, np.inf)
+    assert not galaxy.valid.any()
+    assert meta._dist(galaxy.masks, blackhole).max() > 0
+
+def test_harmony_batch():
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+    for sorting_method in ('best', 'NSGA2', 'SPEA2'):
+        meta = HarmonicSearch(size_pop=5, number_gen=3, batch_size=4, sorting_method=sorting_method,
+                              cache_size=None, random_state=0)
+        meta.fit(X, y, normalize=True)
+        # The memory keeps its size and each generation improvises a batch
+        assert meta.evaluation_stats_['evaluations'] <= 5 + 3 * 4
+        assert meta.transform(X).shape[1] == sum(meta.best_solution())
+
+def test_nondominated_sort():
+    from deap import tools
+    from feature_selection.population import Population, sel_nsga2
+    rng = np.random.RandomState(0)
+    # Few distinct values, so there are ties and duplicates
+    pop = Population(np.ones((60, 3)), rng.randint(0, 5, size=(60, 2)) / 4.)
+    individuals = pop.individuals()
+    for index, individual in enumerate(individuals):
+        individual.index = index
+
+    fronts = pop.fronts()
+    for rank, front in enumerate(tools.sortNondominated(individuals, len(individuals))):
+        assert (fronts[[individual.index for individual in front]] == rank).all()
+        tools.emo.assignCrowdingDist(front)
+    crowding = [individual.fitness.crowding_dist for individual in individuals]
+    assert np.allclose(pop.crowding(fronts), crowding)
+
+    selected = sel_nsga2(pop, 25)
+    assert (np.diff(fronts[selected]) >= 0).all()
+    chosen = [individual.index for individual in tools.selNSGA2(individuals, 25)]
+    assert sorted(fronts[selected]) == sorted(fronts[chosen])
+
+def test_harmony_memory():
+    from feature_selection.harmonic_search import HarmonyMemory
+    from feature_selection.population import Population, sel_nsga2
+    rng = np.random.RandomState(0)
+    for sorting_method in ('best', 'NSGA2'):
+        memory = HarmonyMemory(rng.rand(10, 4) < 0.5, rng.rand(10, 2), sorting_method=sorting_method)
+        reference = Population(memory.masks.copy(), memory.fitness.copy())
+        for _ in range(60):
+            harmony = Population(rng.rand(1, 4) < 0.5, rng.rand(1, 2))
+            memory.admit(harmony)
+
+            # The worst of the memory and the new harmony, by a full sort
+            merged = Population.concatenate([reference, harmony])
+            if sorting_method == 'best':
+                worst = np.argsort(-merged.fitness[:, 0], kind='stable')[-1]
+            else:
+                worst = sel_nsga2(merged, len(merged))[-1]
+            if worst < len(reference):
+                reference.masks[worst], reference.fitness[worst] = harmony.masks[0], harmony.fitness[0]
+
+        # Kept incrementally, the memory holds the harmonies a full sort keeps
+        assert_array_equal(np.sort(memory.fitness, axis=0), np.sort(reference.fitness, axis=0))
+        if sorting_method == 'NSGA2':
+            assert_array_equal(memory._fronts, memory.fronts())
+            assert_array_equal(memory._crowding, memory.crowding())
+
+def test_spea2_selection():
+    from deap import tools
+    from feature_selection.population import Population, sel_spea2
+    rng = np.random.RandomState(0)
+    # Nearly all the rows are non dominated, so the archive is truncated
+    scores = rng.rand(40)
+    pop = Population(np.ones((40, 3)), np.c_[scores, scores + rng.rand(40) / 10])
+    individuals = pop.individuals()
+    for index, individual in enumerate(individuals):
+        individual.index = index
+    chosen = [individual.index for individual in tools.selSPEA2(individuals, 10)]
+    assert_array_equal(sel_spea2(pop, 10), chosen)
+
+    # Too few non dominated rows, they come first
+    pop = Population(np.ones((40, 3)), rng.rand(40, 2))
+    selected = sel_spea2(pop, 20)
+    assert len(set(selected)) == 20
+    assert_array_equal(selected[:len(pop.nondominated())], pop.nondominated())
+
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+    for meta in (SPEA2(size_pop=6, archive_size=3, number_gen=2, random_state=0),
+                 GeneticAlgorithm(size_pop=6, number_gen=2, selection_method='SPEA2', random_state=0)):
+        meta.fit(X, y, normalize=True)
+        assert meta.transform(X).shape[1] == sum(meta.best_solution())
+
+def test_snapshot():
+    import pickle
+    from feature_selection.meta_base import HallOfFame, ParetoFront
+    from feature_selection.population import Population
+    from feature_selection.snapshot import Snapshot
+    rng = np.random.RandomState(0)
+    pop = Population(rng.rand(30, 50) < 0.5, rng.rand(30, 2))
+    for container in (HallOfFame(5), ParetoFront()):
+        container.update(pop)
+        first = Snapshot(container)
+        second = Snapshot(container, first)
+        # Nothing changed, so the arrays are shared
+        assert second.packed is first.packed and second.fitness is first.fitness
+
+        restored = pickle.loads(pickle.dumps(second)).restore()
+        assert type(restored) is type(container)
+        assert [list(ind) for ind in restored] == [list(ind) for ind in container]
+        assert [ind.fitness.values for ind in restored] == [ind.fitness.values for ind in container]
+        assert len(second) == len(container)
+        assert second[0].fitness.values == container[0].fitness.values
+
+def test_log_sink():
+    import os
+    import tempfile
+    dataset = load_breast_cancer()
+    X, y = dataset['data'], dataset['target_names'].take(dataset['target'])
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'log.jsonl')
+        meta = HarmonicSearch(size_pop=5, number_gen=6, skip=2, repeat=2, random_state=0,
+                              log_sink=path)
+        meta.fit(X, y, normalize=True)
+        # Nothing is kept in memory without make_logbook
+        assert not hasattr(meta, 'gen_hof_')
+
+        records = list(LogSink.read(path))
+        assert [(record['repetition'], record['gen']) for record in records] == [
+            (i, g) for i in range(2) for g in (0, 2, 4)]
+        assert set(records[0]['fitness']) >= {'min', 'max', 'avg', '50_percentile'}
+        last = records[-1]['hallOfFame']
+        assert last[0].fitness.values[0] <= meta.best_.keys[0].values[0]
+        assert len(last[0]) == X.shape[1]
+
+def test_statistics():
+    from feature_selection.population import Population, PopulationStatistics
+    rng = np.random.RandomState(0)
+    pop = Population(rng.rand(37, 20) < 0.4, rng.rand(37, 2))
+    scores, sizes = pop.fitness[:, 0], pop.masks.sum(axis=1)
+    record = PopulationStatistics().compile(pop)
+    assert record == PopulationStatistics().compile(pop.individuals())
+
+    assert np.isclose(record['fitness']['avg'], scores.mean())
+    assert np.isclose(record['size']['std'], sizes.std())
+    assert record['size']['min'] == sizes.min() and record['fitness']['max'] == scores.max()
+    # Percentiles are values of the population, the next higher one
+    assert record['fitness']['50_percentile'] == np.sort(scores)[18]
+    assert record['size']['25_percentile'] == np.sort(sizes)[9]
+    assert isinstance(record['size']['75_percentile'], np.integer)
+
 """
 def test_score_grid_func():
     dataset = load_breast_cancer()